@@ -1 +1,3 @@
-# This file is needed in order for aclpubcheck/ to be considered a directory
\ No newline at end of file
+# This file is needed in order for aclpubcheck/ to be considered a directory
+
+__version__ = "0.1"
@@ -0,0 +1,393 @@
+'''
+Batch mode: check many PDFs, optionally on a pool of worker processes, and
+aggregate the per-paper results into a single summary.
+
+The configuration is passed to every worker explicitly (as the pool
+initializer argument), so nothing depends on module globals set in the
+parent process.
+
+A batch runs as a pipeline whose stages overlap, so that slow (e.g.,
+network-mounted) storage does not leave the workers idle:
+
+1. threads read the next PDFs ahead of their check (hashing them on the way
+   for the cache), at most config.prefetch chunks ahead;
+2. the workers check the papers, at most two chunks per worker being queued
+   or checked at a time; each worker encodes the images of the pages with
+   errors on its own threads (Formatter.image_threads);
+3. a thread writes the results to the results file.
+
+The stages are connected by bounded queues, so that a slow stage holds back
+the previous ones instead of letting work pile up in memory.
+
+With config.page_workers > 1, the pages of each paper are also split across
+a pool of page workers, which run the page-local work of the checks (see
+Formatter.check_pages) before the paper is checked as a whole with their
+results. This cuts the time of a single long paper; in a batch on several
+workers, the papers are checked in parallel instead (worker processes
+cannot start processes of their own), and the largest papers are checked
+first so that they do not end up as stragglers.
+'''
+
+from argparse import Namespace
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+import queue
+import threading
+import time
+import traceback
+
+from tqdm import tqdm
+
+
+DEFAULT_CONFIG = {
+    'paper_type': 'long',
+    'disable_name_check': False,
+    'disable_bottom_check': False,
+    'check_references': False,
+    'output_dir': '.',
+    'print_only_errors': False,
+    'paper_timeout': None,
+    'page_timeout': None,
+    'resolution': 150,
+    'annotations': 'full',
+    'reference_backend': 'scholarcy',
+    'cache_dir': None,
+    'main_font_ratio': 0.35,
+    'allowed_fonts': None,
+    'resident_pages': None,
+    'results_file': None,
+    'profile': False,
+    'profile_dir': None,
+    'profiler': 'cprofile',
+    'image_threads': 1,
+    'prefetch': 4,
+    'page_workers': 1,
+}
+
+
+def make_config(**kwargs):
+    """ Return the batch configuration, with defaults for all missing options. """
+    unknown = set(kwargs) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown options: {sorted(unknown)}")
+    config = dict(DEFAULT_CONFIG)
+    config.update(kwargs)
+    return Namespace(**config)
+
+
+# one Formatter per process, built by init_worker
+_formatter = None
+_config = None
+
+
+def init_worker(config):
+    """ Build the Formatter used by this process for all its papers. """
+    global _formatter, _config
+    from .formatchecker import Formatter
+    _config = config
+    _formatter = Formatter(disable_name_check=config.disable_name_check,
+                           disable_bottom_check=config.disable_bottom_check,
+                           paper_timeout=config.paper_timeout,
+                           page_timeout=config.page_timeout,
+                           resolution=config.resolution,
+                           annotations=config.annotations,
+                           reference_backend=config.reference_backend,
+                           cache_dir=config.cache_dir,
+                           main_font_ratio=config.main_font_ratio,
+                           allowed_fonts=config.allowed_fonts,
+                           resident_pages=config.resident_pages,
+                           profile=config.profile,
+                           profile_dir=config.profile_dir,
+                           profiler=config.profiler,
+                           image_threads=config.image_threads)
+
+
+def check_paper(pdf_path, digest=None, pages=None, elapsed=0.0):
+    """
+    Check one PDF (whose SHA-256 is digest, if known, and whose pages were
+    checked by page workers in elapsed seconds, if pages) and return its
+    PaperResult; never raises.
+    """
+    from .results import PaperResult
+    try:
+        if _config.results_file:
+            # the results are reported by the parent process, in a single file
+            return _formatter.check(submission=pdf_path,
+                                    paper_type=_config.paper_type,
+                                    output_dir=_config.output_dir,
+                                    check_references=_config.check_references,
+                                    digest=digest, pages=pages, elapsed=elapsed)
+        _formatter.format_check(submission=pdf_path,
+                                paper_type=_config.paper_type,
+                                output_dir=_config.output_dir,
+                                print_only_errors=_config.print_only_errors,
+                                check_references=_config.check_references,
+                                digest=digest, pages=pages, elapsed=elapsed)
+        return _formatter.result
+    except Exception:
+        # one broken paper must not bring down the whole batch
+        traceback.print_exc()
+        return PaperResult(path=pdf_path, status='failed', traceback=traceback.format_exc())
+
+
+def check_request(pdf_path, paper_type=None, check_references=None, pages=None, elapsed=0.0):
+    """
+    Check one PDF with the options of a single request (the configuration
+    of the worker by default) and return its PaperResult as a dict, without
+    reporting it; never raises.
+    """
+    from .results import PaperResult
+    paper_type = paper_type or _config.paper_type
+    if check_references is None:
+        check_references = _config.check_references
+    try:
+        result = _formatter.check(submission=pdf_path,
+                                  paper_type=paper_type,
+                                  output_dir=_config.output_dir,
+                                  check_references=check_references,
+                                  pages=pages, elapsed=elapsed)
+    except Exception:
+        result = PaperResult(path=pdf_path, status='failed', traceback=traceback.format_exc())
+    return result.to_dict()
+
+
+def check_pages(pdf_path, part, parts, check_references=None):
+    """ Page worker entry point: see Formatter.check_pages; never raises. """
+    if check_references is None:
+        check_references = _config.check_references
+    try:
+        return _formatter.check_pages(pdf_path, _config.output_dir, check_references, part, parts)
+    except Exception:
+        # these pages are checked again with the whole paper
+        traceback.print_exc()
+        return {}
+
+
+def split_pages(pool, pdf_path, parts, check_references=None):
+    """
+    Run the page-local work of a paper on parts page workers of pool, each
+    taking every parts-th page (which spreads long appendices over all of
+    them), and return the results of all the pages and the time it took.
+    """
+    start = time.perf_counter()
+    pages = {}
+    for results in pool.starmap(check_pages, [(pdf_path, part, parts, check_references) for part in range(parts)]):
+        pages.update(results)
+    return pages, time.perf_counter() - start
+
+
+def check_chunk(chunk):
+    """ Worker entry point: check a chunk of (PDF path, digest) pairs. """
+    return [check_paper(pdf_path, digest) for pdf_path, digest in chunk]
+
+
+def make_chunks(fileset, num_workers):
+    """
+    Split the files into chunks of roughly equal total size, largest PDFs
+    first.
+
+    Big files are scheduled first (and usually alone) so that they do not
+    end up as stragglers at the end of the batch; the many small files at
+    the tail are grouped to reduce the inter-process overhead.
+    """
+    sizes = {path: os.path.getsize(path) for path in fileset}
+    ordered = sorted(fileset, key=lambda path: sizes[path], reverse=True)
+    # aim at a few chunks per worker so that the load stays balanced
+    target = sum(sizes.values()) / max(1, num_workers * 4)
+
+    chunks, chunk, chunk_size = [], [], 0
+    for path in ordered:
+        chunk.append(path)
+        chunk_size += sizes[path]
+        if chunk_size >= target:
+            chunks.append(chunk)
+            chunk, chunk_size = [], 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def prefetch(path, digest=False):
+    """
+    Read a PDF, so that it is in the OS cache when it is checked, and return
+    its SHA-256 if digest (None if it cannot be read: its check reports it).
+    """
+    from .cache import file_hash
+    try:
+        if digest:
+            return file_hash(path)
+        with open(path, "rb") as f:
+            while f.read(1 << 20):
+                pass
+    except OSError:
+        pass
+    return None
+
+
+def read_ahead(chunks, out, depth, digest=False):
+    """
+    Put the chunks on the out queue, as lists of (path, digest) pairs, once
+    their files were read by a pool of depth threads; then put None.
+    """
+    def read(chunk):
+        return [(path, prefetch(path, digest)) for path in chunk]
+
+    try:
+        with ThreadPoolExecutor(depth, thread_name_prefix="aclpubcheck-prefetch") as executor:
+            window = deque()
+            for chunk in chunks:
+                window.append(executor.submit(read, chunk))
+                if len(window) >= depth:
+                    # blocks while the queue is full
+                    out.put(window.popleft().result())
+            while window:
+                out.put(window.popleft().result())
+    finally:
+        out.put(None)
+
+
+def prefetched(chunks, depth, digest=False, slots=None):
+    """
+    Yield the chunks, read ahead by a background thread (see read_ahead).
+    With slots (a semaphore), one is taken before yielding each chunk, to be
+    released by the consumer once the chunk is checked.
+    """
+    ready = queue.Queue(maxsize=depth)
+    reader = threading.Thread(target=read_ahead, args=(chunks, ready, depth, digest),
+                              name="aclpubcheck-read-ahead", daemon=True)
+    reader.start()
+    for chunk in iter(ready.get, None):
+        if slots is not None:
+            slots.acquire()
+        yield chunk
+
+
+class ResultWriter(object):
+    """ Reports the results on a background thread, through a bounded queue. """
+
+    def __init__(self, reporter, maxsize=64):
+        self.reporter = reporter
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name="aclpubcheck-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        for result in iter(self.queue.get, None):
+            if self.error is None:
+                try:
+                    self.reporter.report(result)
+                except Exception as e:
+                    # raised in the main thread by close
+                    self.error = e
+
+    def report(self, result):
+        self.queue.put(result)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.reporter.close()
+        if self.error is not None:
+            raise self.error
+
+
+def aggregate(results):
+    """ Merge the per-paper results into one summary dict. """
+    problem_counts = Counter()
+    for result in results:
+        for problem_type, messages in result['logs'].items():
+            problem_counts[problem_type] += len(messages)
+    return {
+        'papers': len(results),
+        'failed': sum(1 for r in results if r['status'] == 'failed'),
+        'partial': sum(1 for r in results if r['status'] == 'partial'),
+        'with_errors': sum(1 for r in results if r['errors'] > 0),
+        'errors': sum(r['errors'] for r in results),
+        'warnings': sum(r['warnings'] for r in results),
+        'problem_counts': dict(problem_counts),
+        'results': sorted(results, key=lambda r: r['path']),
+    }
+
+
+def run_batch(fileset, config, num_workers=1):
+    """
+    Check all files in fileset and return the aggregated summary.
+
+    With config.results_file, the result of each paper is appended to that
+    file as soon as it is available, instead of being reported on the
+    terminal and in an errors-<paper>.json file.
+    """
+    writer = None
+    if config.results_file:
+        from .results import make_file_reporter
+        writer = ResultWriter(make_file_reporter(config.results_file))
+
+    results = []
+
+    def collect(result):
+        if writer is not None:
+            writer.report(result)
+        results.append(result.to_dict())
+
+    # the cache needs the digest of each file, computed while it is read ahead
+    digest = config.cache_dir is not None
+    depth = max(1, config.prefetch)
+    try:
+        if num_workers > 1 and len(fileset) > 1:
+            from multiprocessing.pool import Pool
+            if config.check_references and not config.disable_name_check:
+                # load the bib DB once, before forking, so that the workers share it
+                from .bibdb import preload_bib_db
+                preload_bib_db()
+            chunks = make_chunks(fileset, num_workers)
+            # chunks queued or being checked by the workers
+            slots = threading.Semaphore(2 * num_workers)
+            with Pool(num_workers, initializer=init_worker, initargs=(config,)) as p:
+                try:
+                    with tqdm(total=len(fileset)) as progress:
+                        for chunk_results in p.imap_unordered(check_chunk, prefetched(chunks, depth, digest, slots)):
+                            slots.release()
+                            for result in chunk_results:
+                                collect(result)
+                            progress.update(len(chunk_results))
+                finally:
+                    # on errors, unblock the pool's task handler, which the pool waits for
+                    slots.release(len(chunks))
+        else:
+            init_worker(config)
+            page_pool = None
+            if config.page_workers > 1:
+                from multiprocessing.pool import Pool
+                page_pool = Pool(config.page_workers, initializer=init_worker, initargs=(config,))
+            try:
+                with tqdm(total=len(fileset), disable=writer is None) as progress:
+                    for chunk in prefetched([[path] for path in fileset], depth, digest):
+                        for pdf_path, pdf_digest in chunk:
+                            pages, elapsed = None, 0.0
+                            # a paper found in the cache is not parsed at all, not even by the page workers
+                            if page_pool is not None and not _formatter.is_cached(
+                                    pdf_path, config.paper_type, config.check_references, pdf_digest):
+                                pages, elapsed = split_pages(page_pool, pdf_path, config.page_workers)
+                            collect(check_paper(pdf_path, pdf_digest, pages, elapsed))
+                        progress.update(len(chunk))
+            finally:
+                if page_pool is not None:
+                    page_pool.terminate()
+    finally:
+        if writer is not None:
+            writer.close()
+    return aggregate(results)
+
+
+def print_summary(summary):
+    """ Print the overall statistics of a batch. """
+    print()
+    print(f"Checked {summary['papers']} papers: {summary['with_errors']} with errors, "
+          f"{summary['failed']} failed to be checked, {summary['partial']} ran out of time.")
+    for problem_type in sorted(summary['problem_counts']):
+        print(f"  {summary['problem_counts'][problem_type]} {problem_type}")
+    for result in summary['results']:
+        if result['status'] == 'failed':
+            print(f"  Failed: {result['path']}")
@@ -0,0 +1,118 @@
+'''
+Process-wide rebiber bibliography database, with an on-disk cache.
+
+Building the database means parsing every JSON file listed in rebiber's
+bib_list.txt (about 150MB), which dominates the start-up of the name check.
+The database is built at most once per process, and is stored in a compact
+pickle (one string per entry) whose name depends on rebiber's version and
+data files, so that an upgrade of rebiber invalidates it.
+
+In batch mode the database is loaded in the parent process before the
+workers are forked, so that all workers share it copy-on-write.
+'''
+
+import contextlib
+import gc
+import hashlib
+import os
+import pickle
+
+import rebiber
+
+from .cache import default_cache_dir
+
+
+# bump this when the format of the cached database changes
+CACHE_FORMAT = 1
+
+_bib_db = None
+
+
+class BibIndex(dict):
+    """
+    Normalized title -> bib entry, where each entry is stored as a single
+    string and split back into rebiber's list of lines on access.
+    """
+
+    def __getitem__(self, title):
+        return dict.__getitem__(self, title).splitlines(keepends=True)
+
+    def get(self, title, default=None):
+        return self[title] if title in self else default
+
+
+def rebiber_dir():
+    return os.path.dirname(os.path.abspath(rebiber.__file__))
+
+
+def data_version():
+    """ Return a hash of rebiber's version and of the data files it loads. """
+    h = hashlib.sha1(f"{CACHE_FORMAT} {getattr(rebiber, '__version__', '')}".encode())
+    with open(os.path.join(rebiber_dir(), "bib_list.txt")) as f:
+        filenames = [line.strip() for line in f if line.strip()]
+    for filename in filenames:
+        st = os.stat(os.path.join(rebiber_dir(), filename))
+        h.update(f"{filename} {st.st_size} {st.st_mtime_ns}\n".encode())
+    return h.hexdigest()[:16]
+
+
+def build_bib_db():
+    """ Build the database from rebiber's data files. """
+    filepath = rebiber_dir() + os.sep
+    bib_list_path = os.path.join(filepath, "bib_list.txt")
+    with open(os.devnull, "w") as f, contextlib.redirect_stdout(f):
+        bib_db = rebiber.construct_bib_db(bib_list_path, start_dir=filepath)
+    return BibIndex((title, ''.join(lines)) for title, lines in bib_db.items())
+
+
+def load_bib_db(cache_dir=None):
+    """
+    Return the database of this process, loading it from the on-disk cache
+    (or building and caching it) on the first call.
+    """
+    global _bib_db
+    if _bib_db is not None:
+        return _bib_db
+
+    cache_dir = cache_dir or default_cache_dir()
+    try:
+        cache_path = os.path.join(cache_dir, f"rebiber-{data_version()}.pickle")
+    except OSError:
+        cache_path = None
+
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                _bib_db = BibIndex(pickle.load(f))
+        except Exception:
+            # a corrupted or incompatible cache is simply rebuilt
+            _bib_db = None
+
+    if _bib_db is None:
+        _bib_db = build_bib_db()
+        if cache_path:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(dict(dict.items(_bib_db)), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, cache_path)
+                # databases built from older versions of rebiber are not needed anymore
+                for filename in os.listdir(cache_dir):
+                    if filename.startswith("rebiber-") and filename.endswith(".pickle") \
+                            and os.path.join(cache_dir, filename) != cache_path:
+                        os.remove(os.path.join(cache_dir, filename))
+            except OSError:
+                # the cache is only an optimization, e.g., the directory may be read-only
+                pass
+
+    return _bib_db
+
+
+def preload_bib_db():
+    """
+    Load the database in the current process and move it out of the reach of
+    the garbage collector, so that forked workers keep sharing its pages.
+    """
+    load_bib_db()
+    gc.freeze()
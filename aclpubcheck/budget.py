@@ -0,0 +1,110 @@
+'''
+Wall-clock budgets for checking a paper and each of its pages.
+
+pdfminer is pure Python, so a pathological page can keep the interpreter
+busy for hours. When running on the main thread of a Unix process, the
+budget is enforced with an interval timer (SIGALRM) whose handler raises
+inside the running parser; elsewhere (e.g., in a thread) the budget can
+only be checked before each step starts.
+'''
+
+from contextlib import contextmanager
+import signal
+import threading
+import time
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class PageTimeout(BudgetExceeded):
+    pass
+
+
+class PaperTimeout(BudgetExceeded):
+    pass
+
+
+def _can_interrupt():
+    return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+
+class Budget(object):
+    """ Time limits (in seconds, None for no limit) for one paper and for each of its pages. """
+
+    def __init__(self, paper_timeout=None, page_timeout=None):
+        self.paper_timeout = paper_timeout
+        self.page_timeout = page_timeout
+        self.deadline = None
+        if paper_timeout is not None:
+            self.deadline = time.monotonic() + paper_timeout
+
+    def remaining(self):
+        """ Seconds left for the paper, or None if it is not limited. """
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def expired(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    @contextmanager
+    def guard(self, page_remaining=None):
+        """
+        Run the body within the remaining paper budget and, if given, the
+        remaining budget of the page it works on.
+        """
+        limits = []
+        paper_remaining = self.remaining()
+        if paper_remaining is not None:
+            if paper_remaining <= 0:
+                raise PaperTimeout(f"paper exceeded its budget of {self.paper_timeout} seconds")
+            limits.append((paper_remaining, PaperTimeout(f"paper exceeded its budget of {self.paper_timeout} seconds")))
+        if page_remaining is not None:
+            if page_remaining <= 0:
+                raise PageTimeout(f"page exceeded its budget of {self.page_timeout} seconds")
+            limits.append((page_remaining, PageTimeout(f"page exceeded its budget of {self.page_timeout} seconds")))
+
+        if not limits or not _can_interrupt():
+            yield
+            return
+
+        seconds, error = min(limits, key=lambda limit: limit[0])
+        # guards nest (e.g., a page property computed from another one): the
+        # timer of an enclosing guard that fires first is left alone, and one
+        # that fires later is re-armed with its remaining time on exit
+        enclosing_delay, _ = signal.getitimer(signal.ITIMER_REAL)
+        if enclosing_delay and enclosing_delay <= seconds:
+            yield
+            return
+        fired = []
+
+        def on_alarm(signum, frame):
+            fired.append(True)
+            raise error
+
+        previous = signal.signal(signal.SIGALRM, on_alarm)
+        start = time.monotonic()
+        signal.setitimer(signal.ITIMER_REAL, seconds)
+        try:
+            yield
+        except BudgetExceeded:
+            raise
+        except Exception as e:
+            # pdfplumber wraps the errors raised while parsing a page (e.g., in
+            # PdfminerException): the timeout must still be seen as a timeout
+            if fired:
+                raise error from e
+            raise
+        else:
+            # the body may have caught the timeout (pdfminer catches broad exceptions)
+            if fired:
+                raise error
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+            if enclosing_delay:
+                signal.setitimer(signal.ITIMER_REAL,
+                                 max(enclosing_delay - (time.monotonic() - start), 1e-6))
@@ -0,0 +1,178 @@
+'''
+Local cache of check results, for re-checking papers that did not change.
+
+Results are stored at two levels:
+
+- per paper, keyed by a hash of the PDF's content, the paper type, the
+  check options and the checker version: an unchanged file gets its findings
+  (and the images of the pages with errors) back without being parsed;
+- per page, keyed by a fingerprint of the page's content (its content
+  streams and the resources they use): when a paper changed, only the pages
+  that were edited are analyzed again.
+
+Everything is stored as plain JSON (and PNG) files under the cache
+directory, written atomically so that concurrent workers can share it.
+'''
+
+import hashlib
+import json
+import os
+import shutil
+
+from . import __version__
+
+
+# bump this when the format of the cached results changes
+CACHE_FORMAT = 2
+
+
+def default_cache_dir():
+    return os.environ.get("ACLPUBCHECK_CACHE_DIR",
+                          os.path.join(os.path.expanduser("~"), ".cache", "aclpubcheck"))
+
+
+def file_hash(path):
+    """ Return the SHA-256 of a file's content. """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def options_hash(options):
+    """ Return a short hash of a JSON-serializable dict of options. """
+    return hashlib.sha1(json.dumps(options, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class ObjectHasher(object):
+    """
+    Hashes pdfminer objects (dicts, arrays, streams, references), memoizing
+    indirect objects, so that the fonts and images shared by many pages are
+    hashed only once per paper.
+    """
+
+    def __init__(self):
+        self.memo = {}
+
+    def update(self, h, obj, depth=0):
+        from pdfminer.pdftypes import PDFObjRef, PDFStream
+        if isinstance(obj, PDFObjRef):
+            if obj.objid not in self.memo:
+                # mark the object first, so that cycles terminate
+                self.memo[obj.objid] = b"cycle"
+                sub = hashlib.sha1()
+                try:
+                    self.update(sub, obj.resolve(), depth + 1)
+                except Exception:
+                    sub.update(b"unresolved")
+                self.memo[obj.objid] = sub.digest()
+            h.update(self.memo[obj.objid])
+        elif isinstance(obj, PDFStream):
+            h.update(b"stream")
+            self.update(h, obj.attrs, depth + 1)
+            h.update(obj.get_data() or b"")
+        elif isinstance(obj, dict):
+            h.update(b"dict")
+            for key in sorted(obj, key=str):
+                # /Parent points back to the page tree, which changes with every page
+                if str(key) == "Parent":
+                    continue
+                h.update(str(key).encode())
+                self.update(h, obj[key], depth + 1)
+        elif isinstance(obj, (list, tuple)):
+            h.update(b"list")
+            for item in obj:
+                self.update(h, item, depth + 1)
+        else:
+            h.update(repr(obj).encode())
+
+
+def page_fingerprint(page, hasher):
+    """ Return a fingerprint of a pdfplumber page: its geometry, content streams and resources. """
+    h = hashlib.sha256(f"{CACHE_FORMAT} {__version__}".encode())
+    page_obj = page.page_obj
+    h.update(repr((page.bbox, page_obj.rotate)).encode())
+    hasher.update(h, page_obj.contents)
+    hasher.update(h, page_obj.resources)
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    """ Results of previous checks, stored under cache_dir. """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.papers_dir = os.path.join(self.cache_dir, "papers")
+        self.pages_dir = os.path.join(self.cache_dir, "pages")
+
+    def paper_key(self, digest, paper_type, options):
+        return hashlib.sha256(
+            f"{CACHE_FORMAT} {__version__} {digest} {paper_type} {options_hash(options)}".encode()
+        ).hexdigest()
+
+    def _write_json(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _read_json(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # missing or corrupted entries are simply recomputed
+            return None
+
+    def load_paper(self, key, output_dir):
+        """
+        Return the cached {"findings": [...], "images": [...]} of a paper and
+        copy the cached images of its pages with errors to output_dir; None
+        on a miss.
+        """
+        entry = self._read_json(os.path.join(self.papers_dir, key[:2], f"{key}.json"))
+        if entry is None:
+            return None
+        for png_file_name in entry["images"]:
+            source = os.path.join(self.papers_dir, key[:2], f"{key}-{png_file_name}")
+            if not os.path.exists(source):
+                return None
+            shutil.copyfile(source, os.path.join(output_dir, png_file_name))
+        return entry
+
+    def has_paper(self, key):
+        """ Return True if load_paper would find the results of a paper. """
+        entry = self._read_json(os.path.join(self.papers_dir, key[:2], f"{key}.json"))
+        return entry is not None and all(
+            os.path.exists(os.path.join(self.papers_dir, key[:2], f"{key}-{png_file_name}"))
+            for png_file_name in entry["images"])
+
+    def store_paper(self, key, findings, output_dir, png_file_names):
+        """ Store the findings (as dicts) of a paper and the images it produced. """
+        paper_dir = os.path.join(self.papers_dir, key[:2])
+        os.makedirs(paper_dir, exist_ok=True)
+        for png_file_name in png_file_names:
+            shutil.copyfile(os.path.join(output_dir, png_file_name),
+                            os.path.join(paper_dir, f"{key}-{png_file_name}"))
+        self._write_json(os.path.join(paper_dir, f"{key}.json"),
+                         {"findings": findings, "images": list(png_file_names)})
+
+    def page_path(self, fingerprint):
+        return os.path.join(self.pages_dir, fingerprint[:2], f"{fingerprint}.json")
+
+    def load_page(self, fingerprint):
+        """ Return the cached results of a page (a dict, empty on a miss). """
+        return self._read_json(self.page_path(fingerprint)) or {}
+
+    def store_page(self, fingerprint, entry):
+        self._write_json(self.page_path(fingerprint), entry)
+
+    def page_image_path(self, fingerprint, name):
+        return os.path.join(self.pages_dir, fingerprint[:2], f"{fingerprint}-{name}.png")
+
+    def store_page_image(self, fingerprint, name, source):
+        path = self.page_image_path(fingerprint, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(source, path)
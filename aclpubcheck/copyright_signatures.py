@@ -1,58 +1,265 @@
+'''
+Report of the copyright signatures of the submissions.
+
+    python -m aclpubcheck.copyright_signatures --submissions Submission_Information.csv
+        [--format text|jsonl|csv] [--output PATH] [--shard-by-track | --shard-size N]
+        [--resume] [--num-workers N]
+
+The signatures are written one submission at a time, in the standard ACL
+format (text), or as JSON lines or CSV rows for further processing. The
+report can be split into shards: one per track (the Track column of the
+export, whose submissions are then written track by track), or one per
+--shard-size submissions. Each shard (or the whole report) is written to a
+temporary file, renamed as soon as it is complete, and --resume skips the
+shards that are already complete, so that an interrupted run starts again
+where it stopped. Several exports (e.g. one
+per track) can be given at once; each gets its own report, written on
+--num-workers processes.
+'''
+
 import argparse
+import csv
+import json
+import os
+import re
 import textwrap
-import pandas as pd
-
-
-def write_copyright_signatures(submissions_path):
-
-    def clean_str(value):
-        return '' if pd.isna(value) else value.strip()
-
-    # write all copyright signatures to a single file, noting any problems
-    with open("copyright-signatures.txt", "w") as output_file:
-        df = pd.read_csv(submissions_path, keep_default_na=False)
-        for index, row in df.iterrows():
-            submission_id = row["Submission ID"]
-
-            # NOTE: These were the names in the custom final submission form
-            # for NAACL 2021. Names and structure may be different depending
-            # on your final submission form.
-            signature = clean_str(row["copyrightSig"])
-            org_name = clean_str(row["orgName"])
-            org_address = clean_str(row["orgAddress"])
-
-            # collect all authors and their affiliations
-            authors_parts = []
-            for i in range(1, 25):
-                name_parts = [
-                    clean_str(row[f'{i}: {x} Name'])
-                    for x in ['First', 'Middle', 'Last']]
-                name = ' '.join(x for x in name_parts if x)
-                if name:
-                    affiliation = clean_str(row[f"{i}: Affiliation"])
-                    authors_parts.append(f'{name} ({affiliation})')
-            authors = '\n'.join(authors_parts)
-
-            # write out the copyright signature in the standard ACL format
-            indent = " " * 4
-            output_file.write(f"""
-Submission # {submission_id}
-Title: {row["Title"]}
+
+from .submissions import TRACK_COLUMN, read_submissions
+
+
+BUFFER_SIZE = 1 << 20
+
+
+def signature_record(submission):
+    """ The fields of the copyright signature of a submission, as a dict. """
+    return {
+        'submission_id': submission.id,
+        'track': submission.track,
+        'title': submission.title,
+        'authors': [{'name': author.name, 'affiliation': author.affiliation}
+                    for author in submission.authors],
+        'signature': submission.signature,
+        'job_title': submission.job_title,
+        'org_name': submission.org_name,
+        'org_address': submission.org_address,
+    }
+
+
+class TextWriter(object):
+    """ The copyright signatures in the standard ACL format. """
+
+    extension = ".txt"
+    newline = None
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+
+    def write(self, submission):
+        # collect all authors and their affiliations
+        authors = '\n'.join(f'{author.name} ({author.affiliation})'
+                            for author in submission.authors)
+
+        # write out the copyright signature in the standard ACL format
+        indent = " " * 4
+        self.output_file.write(f"""
+Submission # {submission.id}
+Title: {submission.title}
 Authors:
 {textwrap.indent(authors, indent)}
-Signature: {signature}
-Your job title (if not one of the authors): {clean_str(row["jobTitle"])}
+Signature: {submission.signature}
+Your job title (if not one of the authors): {submission.job_title}
 Name and address of your organization:
-{textwrap.indent(org_name, indent)}
-{textwrap.indent(org_address, indent)}
+{textwrap.indent(submission.org_name, indent)}
+{textwrap.indent(submission.org_address, indent)}
 
 =================================================================
 """)
 
 
+class JsonlWriter(TextWriter):
+    """ One JSON object (see signature_record) per line. """
+
+    extension = ".jsonl"
+
+    def write(self, submission):
+        self.output_file.write(json.dumps(signature_record(submission), ensure_ascii=False))
+        self.output_file.write("\n")
+
+
+class CsvWriter(TextWriter):
+    """ One row per submission; the authors are in one cell, one per line. """
+
+    extension = ".csv"
+    newline = ""
+    fields = ['submission_id', 'track', 'title', 'authors', 'signature',
+              'job_title', 'org_name', 'org_address']
+
+    def __init__(self, output_file):
+        super().__init__(output_file)
+        self.writer = csv.DictWriter(output_file, self.fields)
+        self.writer.writeheader()
+
+    def write(self, submission):
+        record = signature_record(submission)
+        record['authors'] = '\n'.join(f"{author['name']} ({author['affiliation']})"
+                                      for author in record['authors'])
+        self.writer.writerow(record)
+
+
+FORMATS = {"text": TextWriter, "jsonl": JsonlWriter, "csv": CsvWriter}
+
+
+def shard_name(track):
+    """ A file name suffix for a track. """
+    return re.sub(r'[^\w.-]+', '_', track).strip('_') or "no-track"
+
+
+class ShardedReport(object):
+    """
+    The shards of a report, each written through a buffer to a temporary
+    file, which is renamed to the shard when the shard is complete. With
+    resume, the shards that already exist are skipped.
+    """
+
+    def __init__(self, output_path, writer_class, resume=False):
+        self.stem, self.extension = os.path.splitext(output_path)
+        self.writer_class = writer_class
+        self.resume = resume
+        self.open_shards = {}  # key -> (path, file, writer)
+        self.skipped = set()
+        self.paths = []
+
+    def shard_path(self, key):
+        return f"{self.stem}{self.extension}" if key is None else f"{self.stem}-{key}{self.extension}"
+
+    def writer(self, key):
+        """ The writer of the shard key (None: the whole report), or None if it is skipped. """
+        if key in self.open_shards:
+            return self.open_shards[key][2]
+        if key in self.skipped:
+            return None
+        path = self.shard_path(key)
+        if self.resume and os.path.exists(path):
+            self.skipped.add(key)
+            return None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        output_file = open(f"{path}.tmp", "w", encoding="utf-8", buffering=BUFFER_SIZE,
+                           newline=self.writer_class.newline)
+        writer = self.writer_class(output_file)
+        self.open_shards[key] = (path, output_file, writer)
+        return writer
+
+    def finish(self, key):
+        """ Mark the shard key as complete. """
+        path, output_file, _ = self.open_shards.pop(key)
+        output_file.close()
+        os.replace(f"{path}.tmp", path)
+        self.paths.append(path)
+
+    def close(self, complete=True):
+        """ Finish all the open shards, or discard them when the report is not complete. """
+        for key in list(self.open_shards):
+            if complete:
+                self.finish(key)
+            else:
+                path, output_file, _ = self.open_shards.pop(key)
+                output_file.close()
+                os.remove(f"{path}.tmp")
+
+
+def write_copyright_signatures(
+        submissions_path,
+        output_path=None,
+        output_format="text",
+        shard_by_track=False,
+        shard_size=None,
+        resume=False,
+        track_column=TRACK_COLUMN):
+    """ Write the copyright signatures of an export; return the paths of the shards written. """
+    writer_class = FORMATS[output_format]
+    if output_path is None:
+        output_path = f"copyright-signatures{writer_class.extension}"
+    report = ShardedReport(output_path, writer_class, resume)
+
+    submissions = read_submissions(submissions_path, track_column)
+    if shard_by_track:
+        # the submissions of a track are written together (in the order of
+        # the export), so that the shard of each track is complete before
+        # the next one starts, and an interrupted run can be resumed
+        submissions = list(submissions)
+        shards = {}
+        for submission in submissions:
+            shards.setdefault(shard_name(submission.track), len(shards))
+        submissions.sort(key=lambda submission: shards[shard_name(submission.track)])
+
+    complete = False
+    try:
+        shard = None
+        for submission in submissions:
+            if shard_by_track:
+                key = shard_name(submission.track)
+            elif shard_size:
+                key = f"{submission.row // shard_size + 1:04d}"
+            else:
+                key = None
+            # the shards come one after the other, so the previous one is complete
+            if key != shard and shard in report.open_shards:
+                report.finish(shard)
+            shard = key
+            writer = report.writer(key)
+            if writer is not None:
+                writer.write(submission)
+        complete = True
+    finally:
+        report.close(complete)
+    return report.paths
+
+
+def _write_copyright_signatures(args):
+    submissions_path, options = args
+    return write_copyright_signatures(submissions_path, **options)
+
+
+def write_all_copyright_signatures(submissions_paths, num_workers=1, output_path=None,
+                                   output_format="text", **options):
+    """
+    Write the report of each export (the name of the export is added to the
+    output path when there are several), on num_workers processes.
+    """
+    if output_path is None:
+        output_path = f"copyright-signatures{FORMATS[output_format].extension}"
+    tasks = []
+    for submissions_path in submissions_paths:
+        path = output_path
+        if len(submissions_paths) > 1:
+            stem, extension = os.path.splitext(output_path)
+            path = f"{stem}-{os.path.splitext(os.path.basename(submissions_path))[0]}{extension}"
+        tasks.append((submissions_path, dict(options, output_path=path, output_format=output_format)))
+
+    if num_workers > 1 and len(tasks) > 1:
+        from multiprocessing.pool import Pool
+        with Pool(min(num_workers, len(tasks))) as pool:
+            return [path for paths in pool.imap(_write_copyright_signatures, tasks) for path in paths]
+    return [path for task in tasks for path in _write_copyright_signatures(task)]
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument('--submissions', dest='submissions_path',
-                        default='Submission_Information.csv')
+    parser.add_argument('--submissions', dest='submissions_paths', nargs='+',
+                        default=['Submission_Information.csv'])
+    parser.add_argument('--output', dest='output_path', default=None,
+                        help='default: copyright-signatures with the extension of the format')
+    parser.add_argument('--format', dest='output_format', choices=sorted(FORMATS), default='text')
+    shards = parser.add_mutually_exclusive_group()
+    shards.add_argument('--shard-by-track', action='store_true',
+                        help='write one file per track')
+    shards.add_argument('--shard-size', type=int, default=None,
+                        help='write one file per this many submissions')
+    parser.add_argument('--track-column', default=TRACK_COLUMN)
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the files already written by a previous run on the same export')
+    parser.add_argument('--num-workers', type=int, default=1,
+                        help='processes writing the reports of several exports')
     args = parser.parse_args()
-    write_copyright_signatures(**vars(args))
+    for path in write_all_copyright_signatures(**vars(args)):
+        print(path)
@@ -0,0 +1,133 @@
+'''
+Streaming font profile of a paper, for the main-font check.
+
+Counting the font of every character of every page is not needed to decide
+whether the most used font is one of the allowed fonts and is used often
+enough. The FontProfile accumulates the font counts of the pages one at a
+time, visiting the pages in an order spread over the whole paper, and tells
+when the decision is settled:
+
+- when the resource dictionaries of the pages (read without parsing their
+  content) declare a single font, the first page with characters settles it;
+- otherwise, the pages counted so far are treated as a sample of the pages
+  of the paper, and the decision is settled once the share of the leading
+  font is confidently above or below the threshold and confidently ahead of
+  the runner-up. With all the pages counted, the counts are exact.
+'''
+
+from collections import Counter
+import math
+import random
+
+
+DEFAULT_ALLOWED_FONTS = ("NimbusRomNo9L-Reg",
+                         "TeXGyreTermesX-Reg",
+                         "TeXGyreTermes-Reg",
+                         "TimesNewRomanPSMT",
+                         "ICWANT+STIXGeneral-Reg",
+                         "ICZIZQ+Inconsolatazi4-Reg")
+
+# the most used font should be used more than 35% of the time
+DEFAULT_MAIN_FONT_RATIO = 0.35
+
+
+def _name(value):
+    from pdfminer.pdftypes import resolve1
+    from pdfminer.psparser import PSLiteral
+    value = resolve1(value)
+    if isinstance(value, PSLiteral):
+        value = value.name
+    return value.decode("latin-1") if isinstance(value, bytes) else str(value)
+
+
+def resource_fonts(resources, seen=None):
+    """
+    Return the names of the fonts declared in a resource dictionary and in
+    the resources of the form XObjects it uses.
+    """
+    from pdfminer.pdftypes import resolve1
+    seen = set() if seen is None else seen
+    resources = resolve1(resources) or {}
+    fonts = set()
+    for spec in (resolve1(resources.get("Font")) or {}).values():
+        spec = resolve1(spec)
+        descriptor = resolve1(spec.get("FontDescriptor")) or {}
+        fonts.add(_name(descriptor.get("FontName", spec.get("BaseFont", "unknown"))))
+    for xobject in (resolve1(resources.get("XObject")) or {}).values():
+        if id(xobject) in seen:
+            continue
+        seen.add(id(xobject))
+        xobject = resolve1(xobject)
+        if _name(xobject.attrs.get("Subtype")) == "Form" and "Resources" in xobject.attrs:
+            fonts |= resource_fonts(xobject.attrs["Resources"], seen)
+    return fonts
+
+
+def sample_order(num_pages, seed=0):
+    """ Return the (0-based) pages in a fixed pseudo-random order, so that any prefix is spread over the paper. """
+    order = list(range(num_pages))
+    random.Random(seed).shuffle(order)
+    return order
+
+
+class FontProfile(object):
+    """ Font counts of the pages of a paper, accumulated page by page. """
+
+    def __init__(self, num_pages, declared_fonts=None, min_pages=5, confidence=4.0):
+        self.num_pages = num_pages
+        # names of all the fonts declared by the pages, if they could be read
+        self.declared_fonts = declared_fonts
+        self.min_pages = min_pages
+        # number of standard errors the estimates must be away from the decision boundaries
+        self.confidence = confidence
+        self.counts = Counter()
+        self.pages = []  # font counts of each page counted so far
+
+    def add(self, page_counts):
+        self.counts.update(page_counts)
+        self.pages.append(page_counts)
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def main_font(self):
+        """ Return (count, name) of the most used font so far. """
+        return max((count, name) for name, count in self.counts.items())
+
+    def _ratio_bounds(self, weight):
+        """
+        Return the estimate of sum(weight(page)) / sum(chars(page)) over the
+        whole paper and its standard error, from the pages counted so far
+        (ratio estimator, sampling without replacement).
+        """
+        n = len(self.pages)
+        totals = [sum(page.values()) for page in self.pages]
+        weights = [weight(page) for page in self.pages]
+        ratio = sum(weights) / sum(totals)
+        if n >= self.num_pages:
+            return ratio, 0.0
+        mean_total = sum(totals) / n
+        residuals = sum((w - ratio * t) ** 2 for w, t in zip(weights, totals)) / (n - 1)
+        error = math.sqrt((1 - n / self.num_pages) * residuals / n) / mean_total
+        return ratio, error
+
+    def settled(self, threshold):
+        """ Return True if counting the remaining pages cannot reasonably change the decision. """
+        if not self.counts:
+            return False
+        if len(self.pages) >= self.num_pages:
+            return True
+        if self.declared_fonts is not None and len(self.declared_fonts) == 1:
+            return True
+        if len(self.pages) < max(self.min_pages, 2):
+            return False
+
+        ranking = self.counts.most_common(2)
+        main = ranking[0][0]
+        second = ranking[1][0] if len(ranking) > 1 else None
+
+        share, error = self._ratio_bounds(lambda page: page.get(main, 0))
+        if abs(share - threshold) <= self.confidence * error:
+            return False
+        lead, error = self._ratio_bounds(lambda page: page.get(main, 0) - page.get(second, 0))
+        return lead > self.confidence * error
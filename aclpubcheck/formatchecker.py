@@ -4,32 +4,24 @@ python3 formatchecker.py [-h] [--paper_type {long,short,demo,other}] file_or_dir
 
 import argparse
 from argparse import Namespace
+from contextlib import nullcontext
 import json
 from enum import Enum
-from collections import defaultdict
 from os import walk
 from os.path import isfile, join
-import pdfplumber
-from tqdm import tqdm
-from termcolor import colored
 import os
-import numpy as np
+import shutil
+import time
 import traceback
 
-from .name_check import PDFNameCheck
-
-
-class Error(Enum):
-    SIZE = "Size"
-    PARSING = "Parsing"
-    MARGIN = "Margin"
-    SPELLING = "Spelling"
-    FONT = "Font"
-    PAGELIMIT = "Page Limit"
-
-
-class Warn(Enum):
-    BIB = "Bibliography"
+from .pages import PaperPages
+from .budget import Budget, BudgetExceeded
+from .fonts import DEFAULT_ALLOWED_FONTS, DEFAULT_MAIN_FONT_RATIO, FontProfile, sample_order
+from .pagelimit import first_marker_line, has_marker, search_order
+from .results import (Error, Warn, Finding, PaperResult,
+                      TerminalReporter, JSONReporter, ProfileReporter)
+from .cache import ResultCache, file_hash, options_hash
+from .profiling import Profiler, profile_dump
 
 
 class Page(Enum):
@@ -48,7 +40,12 @@ class Margin(Enum):
 
 class Formatter(object):
 
-    def __init__(self):
+    def __init__(self, disable_name_check=False, disable_bottom_check=False,
+                 paper_timeout=None, page_timeout=None,
+                 resolution=150, annotations="full", reference_backend="scholarcy",
+                 cache_dir=None, main_font_ratio=DEFAULT_MAIN_FONT_RATIO, allowed_fonts=None,
+                 resident_pages=None, profile=False, profile_dir=None, profiler="cprofile",
+                 image_threads=1):
         # TODO: these should be constants
         self.right_offset = 4.5
         self.left_offset = 2
@@ -57,286 +54,488 @@ class Formatter(object):
 
         # this is used to check if an area out of the margin is a "false positive",
         # i.e., an area containing invisible symbols. When a candidate area out of
-        # the margin is proposed, this is cropped and if all pixels are equal to
+        # the margin is proposed, its pixels are checked and if all are equal to
         # the background, this is skipped
         self.background_color = 255
-        self.pdf_namecheck = PDFNameCheck()
+        self._pdf_namecheck = None
+
+        # options are stored on the instance (and not read from the parsed
+        # command line) so that worker processes receive them explicitly
+        self.disable_name_check = disable_name_check
+        self.disable_bottom_check = disable_bottom_check
+
+        # wall-clock budgets in seconds (None: no limit)
+        self.paper_timeout = paper_timeout
+        self.page_timeout = page_timeout
+
+        # resolution of the page renderings shared by the pixel checks and the
+        # error images; annotations is one of "full", "preview" or "none"
+        self.resolution = resolution
+        self.annotations = annotations
+        # threads encoding the error images while the next pages are checked (0: none)
+        self.image_threads = image_threads
+        self._image_writer = None
+
+        # how the bibliography is extracted for the name check: "scholarcy" or "local"
+        self.reference_backend = reference_backend
+
+        # the most used font must be one of allowed_fonts, and be used for at
+        # least main_font_ratio of the characters
+        self.main_font_ratio = main_font_ratio
+        self.allowed_fonts = set(allowed_fonts or DEFAULT_ALLOWED_FONTS)
 
+        # maximum number of pages of a paper whose layout is kept in memory (None: all)
+        self.resident_pages = resident_pages
 
-    def format_check(self, submission, paper_type, output_dir = ".", print_only_errors = False, check_references = False):
+        # record the time and memory spent in each check and on each page, and
+        # save a cProfile (or pyinstrument) profile of each paper in profile_dir
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.profiler_kind = profiler
+
+        # results of previous runs, to skip the unchanged papers and pages (None: no cache)
+        self.cache = ResultCache(cache_dir) if cache_dir else None
+
+
+    def format_check(self, submission, paper_type, output_dir = ".", print_only_errors = False, check_references = False,
+                     digest = None, pages = None, elapsed = 0.0):
         """
-        Return True if the paper is correct, False otherwise.
+        Check a paper, print its report and write its logs to errors-<paper>.json in output_dir.
+
+        Return the logs (as a dict) if the paper has errors, or if it has no problems at all (an empty dict);
+        an empty dict if it only has warnings.
         """
         print(f"Checking {submission}")
 
+        result = self.check(submission, paper_type, output_dir, check_references, digest, pages, elapsed)
+
+        TerminalReporter().report(result)
+        if result.profile is not None:
+            ProfileReporter().report(result)
+        if print_only_errors == False:
+            JSONReporter(output_dir).report(result)  # always write a log file even if it is empty
+
+        errors, warnings = result.counts
+        if result.findings and errors < 1:
+            return {}
+        return result.logs_json
+
+
+    def check(self, submission, paper_type, output_dir = ".", check_references = False, digest = None,
+              pages = None, elapsed = 0.0):
+        """
+        Check a paper and return its PaperResult, without reporting it.
+
+        The images of the pages with errors are still saved in output_dir.
+        digest is the SHA-256 of the file, if it was already computed (e.g.,
+        while the file was read ahead by the batch pipeline). pages are the
+        results of the page workers that ran check_pages on the paper, in
+        elapsed seconds (which count towards the time of the paper).
+        """
+        start = time.perf_counter() - elapsed
+        self.start_paper(submission)
+
+        self.profiler = None
+        if self.profile:
+            self.profiler = Profiler()
+            self.profiler.start()
+
+        # the profiler must stop even if the paper cannot be checked, or
+        # memory allocations stay traced in a long-lived worker
+        try:
+            paper_key, cached = None, None
+            if self.cache is not None:
+                paper_key = self.cache.paper_key(digest or file_hash(submission), paper_type,
+                                                 self.cache_options(check_references))
+                cached = self.cache.load_paper(paper_key, output_dir)
+
+            if cached is not None:
+                self.result.cached = True
+                self.result.findings = [Finding.from_dict(f) for f in cached["findings"]]
+                self.result.images += cached["images"]
+            else:
+                # A few papers take hours to check: every page access is bounded by the budget
+                self.budget = Budget(self.paper_timeout, self.page_timeout)
+                if elapsed and self.budget.deadline is not None:
+                    self.budget.deadline -= elapsed
+                import pdfplumber
+                with self.budget.guard():
+                    self.pdf = pdfplumber.open(submission)
+                # every check reads from these cached page records; in streaming
+                # mode, a page keeps what the later checks need when its layout is released
+                try:
+                    self.pages = PaperPages(self.pdf, self.budget, self.cache,
+                                            resident_pages=self.resident_pages,
+                                            summaries=self.page_summaries(check_references),
+                                            profiler=self.profiler, preloaded=pages)
+                except Exception:
+                    # e.g., a malformed page tree: the file must not stay open in a long-lived worker
+                    self.pdf.close()
+                    raise
+                if pages is not None:
+                    self.result.timings["pages"] = elapsed
+                try:
+                    checks = [("size", self.check_page_size),
+                              ("margin", lambda: self.check_page_margin(output_dir)),
+                              ("page_limit", lambda: self.check_page_num(paper_type)),
+                              ("font", self.check_font)]
+                    if check_references:
+                        checks.append(("references", self.check_references))
+                    checks.append(("timeouts", self.check_timeouts))
+
+                    with profile_dump(self.profile_dir, self.number, self.profiler_kind):
+                        for name, check in checks:
+                            self.current_check = name
+                            check_start = time.perf_counter()
+                            with self.measure(name):
+                                check()
+                            self.result.timings[name] = time.perf_counter() - check_start
+                    self.current_check = None
+
+                    if self.pages.timed_out_pages() or self.budget.expired():
+                        self.result.status = "partial"
+
+                    if self.cache is not None:
+                        self.pages.save()
+                        # a partially checked paper is checked again next time
+                        if self.result.status == "ok":
+                            self.cache.store_paper(paper_key, [f.to_dict() for f in self.result.findings],
+                                                   output_dir, self.images)
+                finally:
+                    # the file and the layout of its pages are not kept until the next paper
+                    self.pages.close()
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
+
+        self.result.timings["total"] = time.perf_counter() - start
+        if self.profiler is not None:
+            self.result.profile = self.profiler.to_dict()
+        return self.result
+
+
+    def is_cached(self, submission, paper_type, check_references = False, digest = None):
+        """ Return True if check would take the results of the paper from the cache, without parsing it. """
+        if self.cache is None:
+            return False
+        self.start_paper(submission)
+        paper_key = self.cache.paper_key(digest or file_hash(submission), paper_type,
+                                         self.cache_options(check_references))
+        return self.cache.has_paper(paper_key)
+
+
+    def start_paper(self, submission):
         # TOOD: make this less of a hack
         self.number = submission.split("/")[-1].split("_")[0].replace(".pdf", "")
-        self.pdf = pdfplumber.open(submission)
-        self.logs = defaultdict(list)  # reset log before calling the format-checking functions
+        self.result = PaperResult(path=submission, paper=self.number)
+        self.current_check = None
         self.page_errors = set()
         self.pdfpath = submission
+        self.images = self.result.images  # names of the PNG files written to output_dir
 
-        # TODO: A few papers take hours to check. Consider using a timeout
-        self.check_page_size()
-        self.check_page_margin(output_dir)
-        self.check_page_num(paper_type)
-        self.check_font()
 
+    @staticmethod
+    def page_summaries(check_references):
+        """ The summaries of each page that the document-level checks read. """
+        summaries = ("font_counts", "headings", "declared_fonts")
         if check_references:
-            self.check_references()
-
-        # TODO: put json dump back on
-        output_file = "errors-{0}.json".format(self.number)
-        # string conversion for json dump
-        logs_json = {}
-        for k, v in self.logs.items():
-            logs_json[str(k)] = v
-
-        if self.logs:
-            print(f"Errors. Check {output_file} for details.")
-
-        errors, warnings = 0, 0
-        if self.logs.items():
-            for e, ms in self.logs.items():
-                for m in ms:
-                    if isinstance(e, Error) and e != Error.PARSING:
-                        print(colored("Error ({0}):".format(e.value), "red")+" "+m)
-                        errors += 1
-                    elif e == Error.PARSING:
-                        print(colored("Parsing Error:".format(e.value), "yellow")+" "+m)
-                    else:
-                        print(colored("Warning ({0}):".format(e.value), "yellow")+" "+m)
-                        warnings += 1
-
-
-            # English nominal morphology
-            error_text = "errors"
-            if errors == 1:
-                error_text = "error"
-            warning_text = "warnings"
-            if warnings == 1:
-                warning_text = "warning"
-
-
-            if print_only_errors == False:
-                json.dump(logs_json, open(os.path.join(output_dir,output_file), 'w'))  # always write a log file even if it is empty
-
-            # display to user
-            print()
-            print("We detected {0} {1} and {2} {3} in your paper.".format(*(errors, error_text, warnings, warning_text)))
-            print("In general, it is required that you fix errors for your paper to be published. Fixing warnings is optional, but recommended.")
-            print("Important: Some of the margin errors may be spurious. The library detects the location of images, but not whether they have a white background that blends in.")
-            print("Important: Some of the warnings generated for citations may be spurious and inaccurate, due to parsing and indexing errors.")
-            print("We encourage you to double check the citations and update them depending on the latest source. If you believe that your citation is updated and correct, then please ignore those warnings.")
-
-            if errors >= 1:
-                return logs_json
-            else:
-                return {}
-
+            summaries += ("text", "uris")
+        return summaries
 
-        else:
-            if print_only_errors == False:
-                json.dump(logs_json, open(os.path.join(output_dir,output_file), 'w'))
-
-            print(colored("All Clear!", "green"))
-            return logs_json
 
+    def check_pages(self, submission, output_dir = ".", check_references = False, part = 0, parts = 1):
+        """
+        Run the page-local work of the checks on the pages i of a paper such
+        that i % parts == part, for a page worker: the page size and margin
+        checks (saving the error images in output_dir) and the summaries of
+        the pages read by the document-level checks.
+
+        Return page index -> results of the page (see PageRecord.export),
+        to be passed to check, which merges the results of all the parts in
+        page order and runs the document-level checks.
+        """
+        import pdfplumber
+        self.start_paper(submission)
+        self.profiler = None
+        self.budget = Budget(self.paper_timeout, self.page_timeout)
+        with self.budget.guard():
+            self.pdf = pdfplumber.open(submission)
+        summaries = self.page_summaries(check_references)
+        try:
+            self.pages = PaperPages(self.pdf, self.budget, self.cache,
+                                    resident_pages=self.resident_pages, summaries=summaries)
+        except Exception:
+            self.pdf.close()
+            raise
+        self.pages.selection = range(part, len(self.pages), parts)
+        try:
+            self.check_page_size()
+            self.check_page_margin(output_dir)
+            results = {}
+            for p in self.pages:
+                p.summarize(summaries)
+                results[p.index] = p.export()
+            if self.cache is not None:
+                self.pages.save()
+            return results
+        finally:
+            self.pages.close()
+
+
+    @property
+    def pdf_namecheck(self):
+        # rebiber, pybtex and pylatexenc are only imported if the name check runs
+        if self._pdf_namecheck is None:
+            from .name_check import PDFNameCheck
+            self._pdf_namecheck = PDFNameCheck()
+        return self._pdf_namecheck
+
+
+    @property
+    def image_writer(self):
+        # created on first use, in the process that checks the papers
+        if self._image_writer is None and self.image_threads:
+            from concurrent.futures import ThreadPoolExecutor
+            self._image_writer = ThreadPoolExecutor(self.image_threads, thread_name_prefix="aclpubcheck-png")
+        return self._image_writer
+
+
+    def measure(self, check):
+        """ Measure the time and memory spent in a check, when profiling. """
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.measure(self.profiler.checks, check)
+
+
+    @property
+    def logs(self):
+        """ Problem type -> messages found in the last paper checked. """
+        return self.result.logs
+
+
+    def report(self, kind, message, page=None, bbox=None):
+        """ Record a problem found by the running check. """
+        self.result.findings.append(Finding(kind, message, self.current_check, page,
+                                            tuple(float(v) for v in bbox) if bbox is not None else None))
+
+
+    def cache_options(self, check_references):
+        """ Return the options that the results of a paper depend on. """
+        return {
+            'number': self.number,
+            'disable_name_check': self.disable_name_check,
+            'disable_bottom_check': self.disable_bottom_check,
+            'check_references': check_references,
+            'resolution': self.resolution,
+            'annotations': self.annotations,
+            'reference_backend': self.reference_backend,
+            'offsets': (self.right_offset, self.left_offset, self.top_offset, self.bottom_offset),
+            'main_font_ratio': self.main_font_ratio,
+            'allowed_fonts': sorted(self.allowed_fonts),
+        }
 
 
     def check_page_size(self):
         """ Checks the paper size (A4) of each pages in the submission. """
 
         pages = []
-        for i, page in enumerate(self.pdf.pages):
+        for page in self.pages:
 
             if (round(page.width), round(page.height)) != (Page.WIDTH.value, Page.HEIGHT.value):
-                pages.append(i+1)
+                pages.append(page.index+1)
         for page in pages:
             error = "Page #{} is not A4.".format(page)
-            self.logs[Error.SIZE] += [error]
+            self.report(Error.SIZE, error, page=page)
         self.page_errors.update(pages)
 
 
     def check_page_margin(self, output_dir):
         """ Checks if any text or figure is in the margin of pages. """
-
-        pages_image = defaultdict(list)
-        pages_text = defaultdict(list)
+        from .render import PageRaster
+
+        # the violations of an unchanged page are read back from the cache
+        cache_name = "margin-" + options_hash({
+            'resolution': self.resolution,
+            'annotations': self.annotations,
+            'disable_bottom_check': self.disable_bottom_check,
+            'offsets': (self.right_offset, self.left_offset, self.top_offset, self.bottom_offset),
+            'background_color': self.background_color,
+        })
+
+        pages_messages = {}
         perror = []
-        for i, p in enumerate(self.pdf.pages):
+        writes = []  # (Future of an error image, page to store it for in the cache)
+        for p in self.pages:
+            i = p.index
             if i+1 in self.page_errors:
                 continue
+            # the page is rendered (at most once) only when the first candidate shows up
+            raster = PageRaster(p, resolution=self.resolution)
             try:
-                # Parse images
-                # 57 pixels (72ppi) = 2cm; 71 pixels (72ppi) = 2.5cm.
-                for image in p.images:
-                    violation = None
-                    if int(image["bottom"]) > 0 and float(image["top"]) < (57-self.top_offset):
-                        violation = Margin.TOP
-                    elif int(image["x1"]) > 0 and float(image["x0"]) < (71-self.left_offset):
-                        violation = Margin.LEFT
-                    elif int(image["x0"]) < Page.WIDTH.value and Page.WIDTH.value-float(image["x1"]) < (71-self.right_offset):
-                        violation = Margin.RIGHT
-
-                    if violation:
-                        # if the image is completely white, it can be skipped
-
-                        # get the actual visible area
-                        x0 = max(0, int(image["x0"]))
-                        # check the intersection with the right margin to handle larger images
-                        # but with an "overflow" that is of the same color of the backgrond
-                        if violation == Margin.RIGHT:
-                            x0 = max(x0, Page.WIDTH.value - 71 + self.right_offset)
-
-                        x1 = min(int(image["x1"]), Page.WIDTH.value)
-                        if violation == Margin.LEFT:
-                            x1 = min(x1, 71 - self.right_offset)
-
-                        y0 = max(0, int(image["top"]))
-
-                        y1 = min(int(image["bottom"]), Page.HEIGHT.value)
-                        if violation == Margin.TOP:
-                            y1 = min(y1, 57-self.top_offset)
-
-                        bbox = (x0, y0, x1, y1)
-
-                        # avoid problems in cropping images too small
-                        if x1 - x0 <= 1 or y1 - y0 <= 1:
-                            continue
-
-                        # cropping the image to check if it is white
-                        # i.e., all pixels set to 255
-                        cropped_page = p.crop(bbox)
-                        try:
-                          image_obj = cropped_page.to_image(resolution=100)
-                          if np.mean(image_obj.original) != self.background_color:
-                            pages_image[i] += [(image, violation)]
-                        # if there are some errors during cropping, it is better to check
-                        except:
-                          pages_image[i] += [(image, violation)]
-
-                # Parse texts
-                for j, word in enumerate(p.extract_words(extra_attrs=["non_stroking_color", "stroking_color"])):
-                    violation = None
-
-                    #if word["non_stroking_color"] == (0, 0, 0) or word["non_stroking_color"] == 0 or word["stroking_color"] == 0:
-                    if word["non_stroking_color"] == (0, 0, 0) or word["non_stroking_color"] == [0]:
-                        continue
-
-                    if word["non_stroking_color"] is None and word["stroking_color"] is None:
-                        continue
-
-                    if int(word["bottom"]) > 0 and float(word["top"]) < (57-self.top_offset):
-                        violation = Margin.TOP
-                    elif int(word["x1"]) > 0 and float(word["x0"]) < (71-self.left_offset):
-                        violation = Margin.LEFT
-                    elif int(word["x0"]) < Page.WIDTH.value and Page.WIDTH.value-float(word["x1"]) < (71-self.right_offset):
-                        violation = Margin.RIGHT
-
-                    if violation and int(word["x0"]) < Page.WIDTH.value and int(word["x1"]) >= 0 and int(word["bottom"]) >= 0:
-                        # if the area image is completely white, it can be skipped
-                        # get the actual visible area
-                        x0 = max(0, int(word["x0"]))
-                        # check the intersection with the right margin to handle larger images
-                        # but with an "overflow" that is of the same color of the backgrond
-                        if violation == Margin.RIGHT:
-                            x0 = max(x0, Page.WIDTH.value - 71 + self.right_offset)
-
-                        x1 = min(int(word["x1"]), Page.WIDTH.value)
-                        if violation == Margin.LEFT:
-                            x1 = min(x1, 71 - self.right_offset)
-
-                        y0 = max(0, int(word["top"]))
-
-                        y1 = min(int(word["bottom"]), Page.HEIGHT.value)
-                        if violation == Margin.TOP:
-                            y1 = min(y1, 57-self.top_offset)
-
-                        bbox = (x0, y0, x1, y1)
-
-                        # avoid problems in cropping images too small
-                        if x1 - x0 <= 1 or y1 - y0 <= 1:
-                            continue
-
-                        # cropping the image to check if it is white
-                        # i.e., all pixels set to 255
-                        try:
-                            cropped_page = p.crop(bbox)
-                            image_obj = cropped_page.to_image(resolution=100)
-                            if np.mean(image_obj.original) != self.background_color:
-                                print("Found text violation:\t" + str(violation) + "\t" + str(word))
-                                pages_text[i] += [(word, violation)]
-                        except:
-                          # if there are some errors during cropping, it is better to check
-                          pages_image[i] += [(word, violation)]
-
-                # CHECK THE AREA BELOW THE TEXT, it should be empty as it is expected to
-                # be populated with watermark and pages during the construction of the
-                # proceedings
-                if args.disable_bottom_check:
-                    bpixels = 62
-                    bbox = (0, Page.HEIGHT.value - bpixels, Page.WIDTH.value - self.bottom_offset, Page.HEIGHT.value - self.bottom_offset)
-                    word = {"top": bbox[1], "bottom": bbox[3]}
-            
-                    # cropping the image to check if it is white
-                    # i.e., all pixels set to 255
+                cached = p.cached(cache_name)
+            except BudgetExceeded:
+                continue
+            if cached is not None:
+                texts = [(box, Margin(violation)) for box, violation in cached["texts"]]
+                images = [(box, Margin(violation)) for box, violation in cached["images"]]
+            else:
+                texts, images = [], []
+                try:
+                    self.find_margin_violations(p, raster, texts, images)
+                    p.store(cache_name, {
+                        "texts": [(self.margin_box(word), violation.value) for word, violation in texts],
+                        "images": [(self.margin_box(image), violation.value) for image, violation in images],
+                    })
+                except BudgetExceeded:
+                    # reported by check_timeouts; the violations found so far are kept
+                    pass
+                except:
+                    traceback.print_exc()
+                    perror.append(i+1)
+
+            # the error image is drawn on the page rendering used by the checks above
+            if texts or images:
+                messages, boxes = self.describe_margin_violations(i, texts, images)
+                pages_messages[i] = list(zip(messages, boxes))
+                if self.annotations != "none":
+                    png_file_name = "errors-{0}-page-{1}.png".format(*(self.number, i+1))
+                    png_path = os.path.join(output_dir, png_file_name)
                     try:
-                        cropped_page = p.crop(bbox)
-                        image_obj = cropped_page.to_image(resolution=100)
-                        if np.mean(image_obj.original) != self.background_color:
-                            print("Found text violation:\t" + str(Margin.BOTTOM) + "\t" + str(word))
-                            pages_text[i] += [(word, Margin.BOTTOM)]
-                    except:
-                      # if there are some errors during cropping, it is better to check
-                      pages_image[i] += [(word, Margin.BOTTOM)]
-                      traceback.print_exc()
+                        cached_png = p.fingerprint and self.cache.page_image_path(p.fingerprint, cache_name)
+                        if cached is not None and p.saved_image == png_file_name:
+                            pass  # saved by the page worker that checked the page
+                        elif cached is not None and cached_png and os.path.exists(cached_png):
+                            shutil.copyfile(cached_png, png_path)
+                        else:
+                            write = raster.save_annotated(boxes, png_path, preview=self.annotations == "preview",
+                                                          executor=self.image_writer)
+                            store = cached_png and p.cached(cache_name) is not None
+                            writes.append((write, p.fingerprint if store else None, png_path))
+                        p.saved_image = png_file_name
+                        self.images.append(png_file_name)
+                    except BudgetExceeded:
+                        pass
+            raster.close()
 
-            except:
-                traceback.print_exc()
-                perror.append(i+1)
+        # the images are complete when the check is
+        for write, fingerprint, png_path in writes:
+            if write is not None:
+                write.result()
+            if fingerprint is not None:
+                self.cache.store_page_image(fingerprint, cache_name, png_path)
 
         if perror:
             self.page_errors.update(perror)
-            self.logs[Error.PARSING] = ["Error occurs when parsing page {}.".format(perror)]
+            self.report(Error.PARSING, "Error occurs when parsing page {}.".format(perror))
 
-        if pages_text or pages_image:
-            pages = sorted(set(pages_text.keys()).union(set((pages_image.keys()))))
-            for page in pages:
-                im = self.pdf.pages[page].to_image(resolution=150)
-                for (word, violation) in pages_text[page]:
-
-                    bbox = None
-                    if violation == Margin.RIGHT:
-                        self.logs[Error.MARGIN] += ["Text on page {} bleeds into the right margin.".format(page+1)]
-                        bbox = (Page.WIDTH.value-80, int(word["top"]-20), Page.WIDTH.value-20, int(word["bottom"]+20))
-                        im.draw_rect(bbox, fill=None, stroke="red", stroke_width=5)
-                    elif violation == Margin.LEFT:
-                        self.logs[Error.MARGIN] += ["Text on page {} bleeds into the left margin.".format(page+1)]
-                        bbox = (20, int(word["top"]-20), 80, int(word["bottom"]+20))
-                        im.draw_rect(bbox, fill=None, stroke="red", stroke_width=5)
-                    elif violation == Margin.TOP:
-                        self.logs[Error.MARGIN] += ["Text on page {} bleeds into the top margin.".format(page+1)]
-                        bbox = (20, int(word["top"]-20), 80, int(word["bottom"]+20))
-                        im.draw_rect(bbox, fill=None, stroke="red", stroke_width=5)
-                    elif violation == Margin.BOTTOM:
-                        self.logs[Error.MARGIN] += ["Text on page {} bleeds into the bottom margin. It should be empty (e.g., without page number) and populated when building the proceedings.".format(page+1)]
-                        bbox = (0, int(word["top"]), Page.WIDTH.value, int(word["bottom"]))
-                        im.draw_rect(bbox, fill=None, stroke="red", stroke_width=5)
-                    else:
-                        # TODO: add bottom margin violations
-                        pass
+        for page in sorted(pages_messages):
+            for message, box in pages_messages[page]:
+                self.report(Error.MARGIN, message, page=page+1, bbox=box)
+
+
+    def find_margin_violations(self, p, raster, texts, images):
+        """ Appends the (word, violation) and (image, violation) pairs found on a page to texts and images. """
+        from .margins import find_margin_candidates
 
+        # Parse images
+        page_images = p.images
+        for k, violation, bbox in find_margin_candidates(
+                page_images, Page.WIDTH.value, Page.HEIGHT.value,
+                self.left_offset, self.right_offset, self.top_offset):
+            image, violation = page_images[k], Margin(violation)
 
-                for (image, violation) in pages_image[page]:
+            # if the image is completely white, it can be skipped
+            # i.e., all pixels set to 255
+            try:
+              if not raster.is_blank(bbox, self.background_color):
+                images += [(image, violation)]
+            except BudgetExceeded:
+              raise
+            # if there are some errors during cropping, it is better to check
+            except:
+              images += [(image, violation)]
+
+        # Parse texts
+        words = []
+        for word in p.words:
+            #if word["non_stroking_color"] == (0, 0, 0) or word["non_stroking_color"] == 0 or word["stroking_color"] == 0:
+            if word["non_stroking_color"] == (0, 0, 0) or word["non_stroking_color"] == [0]:
+                continue
+
+            if word["non_stroking_color"] is None and word["stroking_color"] is None:
+                continue
+
+            words.append(word)
+
+        for k, violation, bbox in find_margin_candidates(
+                words, Page.WIDTH.value, Page.HEIGHT.value,
+                self.left_offset, self.right_offset, self.top_offset,
+                visible_only=True):
+            word, violation = words[k], Margin(violation)
+
+            # if the area image is completely white, it can be skipped
+            # i.e., all pixels set to 255
+            try:
+                if not raster.is_blank(bbox, self.background_color):
+                    texts += [(word, violation)]
+            except BudgetExceeded:
+                raise
+            except:
+              # if there are some errors during cropping, it is better to check
+              images += [(word, violation)]
+
+        # CHECK THE AREA BELOW THE TEXT, it should be empty as it is expected to
+        # be populated with watermark and pages during the construction of the
+        # proceedings
+        if not self.disable_bottom_check:
+            bpixels = 62
+            bbox = (0, Page.HEIGHT.value - bpixels, Page.WIDTH.value - self.bottom_offset, Page.HEIGHT.value - self.bottom_offset)
+            word = {"top": bbox[1], "bottom": bbox[3]}
+
+            # checking if the area is white
+            # i.e., all pixels set to 255
+            try:
+                if not raster.is_blank(bbox, self.background_color):
+                    texts += [(word, Margin.BOTTOM)]
+            except BudgetExceeded:
+                raise
+            except:
+              # if there are some errors during cropping, it is better to check
+              images += [(word, Margin.BOTTOM)]
+              traceback.print_exc()
+
+
+    @staticmethod
+    def margin_box(obj):
+        """ The part of a word or image that the margin messages use, as a JSON-serializable dict. """
+        return {k: float(obj[k]) for k in ("x0", "top", "x1", "bottom") if k in obj}
+
+
+    def describe_margin_violations(self, page, texts, images):
+        """ Returns the error messages and the boxes to highlight for the margin violations of a page. """
+
+        messages, boxes = [], []
+        for (word, violation) in texts:
 
-                    self.logs[Error.MARGIN] += ["An image on page {} bleeds into the margin.".format(page+1)]
-                    bbox = (image["x0"], image["top"], image["x1"], image["bottom"])
-                    im.draw_rect(bbox, fill=None, stroke="red", stroke_width=5)
+            if violation == Margin.RIGHT:
+                messages += ["Text on page {} bleeds into the right margin.".format(page+1)]
+                boxes += [(Page.WIDTH.value-80, int(word["top"]-20), Page.WIDTH.value-20, int(word["bottom"]+20))]
+            elif violation == Margin.LEFT:
+                messages += ["Text on page {} bleeds into the left margin.".format(page+1)]
+                boxes += [(20, int(word["top"]-20), 80, int(word["bottom"]+20))]
+            elif violation == Margin.TOP:
+                messages += ["Text on page {} bleeds into the top margin.".format(page+1)]
+                boxes += [(20, int(word["top"]-20), 80, int(word["bottom"]+20))]
+            elif violation == Margin.BOTTOM:
+                messages += ["Text on page {} bleeds into the bottom margin. It should be empty (e.g., without page number) and populated when building the proceedings.".format(page+1)]
+                boxes += [(0, int(word["top"]), Page.WIDTH.value, int(word["bottom"]))]
 
-                png_file_name = "errors-{0}-page-{1}.png".format(*(self.number, page+1))
-                im.save(os.path.join(output_dir, png_file_name), format="PNG")
-                #+ "Specific text: "+str([v for k, v in pages_text.values()])]
+        for (image, violation) in images:
+
+            messages += ["An image on page {} bleeds into the margin.".format(page+1)]
+            boxes += [(image["x0"], image["top"], image["x1"], image["bottom"])]
+
+        return messages, boxes
 
 
     def check_page_num(self, paper_type):
@@ -347,68 +546,109 @@ class Formatter(object):
         # thresholds for different types of papers
         standards = {"short": 5, "long": 9, "demo": 7, "other": float("inf")}
         page_threshold = standards[paper_type.lower()]
-        candidates = {"References", "Acknowledgments", "Acknowledgement", "Acknowledgment", "EthicsStatement", "EthicalConsiderations", "Ethicalconsiderations", "BroaderImpact", "EthicalConcerns", "EthicalStatement", "EthicalDeclaration", "Limitations", "Limitation"}
-        #acks = {"Acknowledgment", "Acknowledgement"}
 
         # Find (references, acknowledgements, ethics).
-        marker = None
-        if len(self.pdf.pages) <= page_threshold:
+        if len(self.pages) <= page_threshold:
             return
 
-        for i, page in enumerate(self.pdf.pages):
+        # start from the first page with a heading that looks like one of them
+        guess = page_threshold + 1
+        for i in range(page_threshold + 1):
             if i+1 in self.page_errors:
                 continue
-            text = page.extract_text().split('\n')
-            for j, line in enumerate(text):
-                if marker is None and any(x in line for x in candidates):
-                    marker = (i+1, j+1)
-                #if "Acknowl" in line and all(x not in line for x in acks):
-                #    self.logs[Error.SPELLING] = ["'Acknowledgments' was misspelled."]
-
-        # if the first marker appears after the first line of page 10,
-        # there is high probability the paper exceeds the page limit.
-
-        # If we reached this state and that marker is still None it means all pages already have errors
-        # We can return here to print the already existing errors
-        if marker is None:
-            return
-
-        if marker > (page_threshold + 1, 1):
-            page, line = marker
-            self.logs[Error.PAGELIMIT] = [f"Paper exceeds the page limit "
-                                      f"because first (References, "
-                                      f"Acknowledgments, Ethics Statement) was found on "
-                                      f"page {page}, line {line}."]
+            try:
+                headings = self.pages[i].headings
+            except Exception:
+                # only a guess: the page is searched anyway
+                continue
+            if any(has_marker(h) for h in headings):
+                guess = i+1
+                break
+
+        # if the first marker appears up to the first line of page 10, the
+        # paper is within the page limit, and no other page needs to be read
+        for page in search_order(len(self.pages), page_threshold, guess):
+            lines = self.page_lines(page)
+            stop = 1 if page == page_threshold + 1 else None
+            if lines is not None and first_marker_line(lines, 0, stop) is not None:
+                return
+
+        # otherwise, the first marker after it shows that the paper exceeds the limit
+        for page in range(page_threshold + 1, len(self.pages) + 1):
+            lines = self.page_lines(page)
+            start = 1 if page == page_threshold + 1 else 0
+            line = first_marker_line(lines, start) if lines is not None else None
+            if line is not None:
+                self.report(Error.PAGELIMIT, f"Paper exceeds the page limit "
+                                             f"because first (References, "
+                                             f"Acknowledgments, Ethics Statement) was found on "
+                                             f"page {page}, line {line+1}.", page=page)
+                return
+
+        # If we reached this state no marker was found, e.g., all pages already
+        # have errors: only the already existing errors are printed
+
+
+    def page_lines(self, page):
+        """ Return the text lines of a (1-based) page, or None if the page is skipped. """
+        if page in self.page_errors:
+            return None
+        try:
+            return self.pages[page-1].lines
+        except BudgetExceeded:
+            return None
 
 
     def check_font(self):
         """ Checks the fonts. """
 
-        correct_fontnames = set(["NimbusRomNo9L-Reg",
-                                 "TeXGyreTermesX-Reg",
-                                 "TeXGyreTermes-Reg",
-                                 "TimesNewRomanPSMT",
-                                 "ICWANT+STIXGeneral-Reg",
-                                 "ICZIZQ+Inconsolatazi4-Reg"
-                                 ])
+        correct_fontnames = self.allowed_fonts
+
+        # the fonts declared by the pages are read without parsing their content
+        try:
+            declared_fonts = set()
+            for page in self.pages:
+                declared_fonts.update(page.declared_fonts)
+        except Exception:
+            declared_fonts = None
 
-        fonts = defaultdict(int)
-        for i, page in enumerate(self.pdf.pages):
+        # count the fonts of the pages until the decision cannot change
+        fonts = FontProfile(len(self.pages), declared_fonts)
+        for i in sample_order(len(self.pages)):
             try:
-                for char in page.chars:
-                    fonts[char['fontname']] += 1
+                fonts.add(self.pages[i].font_counts)
+            except BudgetExceeded:
+                continue
             except:
-                self.logs[Error.FONT] += [f"Can't parse page #{i+1}"]
+                self.report(Error.FONT, f"Can't parse page #{i+1}", page=i+1)
+            if fonts.settled(self.main_font_ratio):
+                break
+
+        if not fonts.total():
+            # pages that ran out of time are reported by check_timeouts
+            if not self.budget.expired() and not self.pages.timed_out_pages():
+                self.report(Error.FONT, "Can't find any font")
+            return
 
-        max_font_count, max_font_name = max((count, name) for name, count in fonts.items())  # find most used font
-        sum_char_count = sum(fonts.values())
+        max_font_count, max_font_name = fonts.main_font()  # find most used font
+        sum_char_count = fonts.total()
 
-        # TODO: make this a command line argument
-        if max_font_count / sum_char_count < 0.35:  # the most used font should be used more than 35% of the time
-            self.logs[Error.FONT] += ["Can't find the main font"]
+        if max_font_count / sum_char_count < self.main_font_ratio:  # the most used font should be used often enough
+            self.report(Error.FONT, "Can't find the main font")
 
         if not any([correct_fontname in max_font_name for correct_fontname in correct_fontnames]):  # the most used font should be `correct_fontname`
-            self.logs[Error.FONT] += [f"Wrong font. The main font used is {max_font_name} when it should a font in {correct_fontnames}."]
+            self.report(Error.FONT, f"Wrong font. The main font used is {max_font_name} when it should a font in {correct_fontnames}.")
+
+    def check_timeouts(self):
+        """ Reports the pages (or the paper) that ran out of their time budget. """
+
+        pages = self.pages.timed_out_pages()
+        if pages:
+            self.page_errors.update(pages)
+            for page in pages:
+                self.report(Error.PARSING, f"Page {page} ran out of its time budget and was only partially checked.", page=page)
+        if self.budget.expired():
+            self.report(Error.PARSING, f"The paper exceeded the time budget of {self.paper_timeout} seconds and was only partially checked.")
 
     def make_name_check_config(self):
         """Configure the name checking parameters"""
@@ -421,7 +661,8 @@ class Formatter(object):
             'last_name': True, # Consider only last name changes
             'ref_string': 'References', # How the bibilography starts
             'mode': 'ensemble', # The mode for scholarcy, ensemble worked the best for ACL papers
-            'initials': True # Allow abbreviating first names to initials only.
+            'initials': True, # Allow abbreviating first names to initials only.
+            'backend': self.reference_backend # How the bibliography is extracted from the PDF
         }
 
         return Namespace(**config_dict)
@@ -436,21 +677,24 @@ class Formatter(object):
         arxiv_url_count = 0
         all_url_count = 0
 
-        for i, page in enumerate(self.pdf.pages):
+        for i, page in enumerate(self.pages):
             try:
-                page_text = page.extract_text()
+                page_text = page.text
+                lines = page.lines
+            except BudgetExceeded:
+                continue
             except:
                 page_text = ""
-                self.logs[Warn.BIB] += [f"Can't parse page #{i+1}"]
+                lines = [""]
+                self.report(Warn.BIB, f"Can't parse page #{i+1}", page=i+1)
 
-            lines = page_text.split('\n')
             for j, line in enumerate(lines):
                 if "References" in line:
                     found_references = True
                     break
             if found_references:
                 arxiv_word_count += page_text.lower().count('arxiv')
-                urls = [h['uri'] for h in page.hyperlinks]
+                urls = page.uris
                 urls = set(urls)  # When link text spans more than one line, it returns the same url multiple times
                 for url in urls:
                     if 'doi.org' in url:
@@ -461,43 +705,106 @@ class Formatter(object):
 
         # The following checks fail in ~60% of the papers. TODO: relax them a bit
 
-        if args.disable_name_check:
+        if not self.disable_name_check:
             config = self.make_name_check_config()
-            output_strings = self.pdf_namecheck.execute(config)
-            self.logs[Warn.BIB] += output_strings
+            output_strings = self.pdf_namecheck.execute(config, self.pages)
+            for output_string in output_strings:
+                self.report(Warn.BIB, output_string)
 
         if doi_url_count < 3:
-            self.logs[Warn.BIB] += [f"Bibliography should use ACL Anthology DOIs whenever possible. Only {doi_url_count} references do."]
+            self.report(Warn.BIB, f"Bibliography should use ACL Anthology DOIs whenever possible. Only {doi_url_count} references do.")
 
         if arxiv_url_count > 0.2 * all_url_count:  # only 20% of the links are allowed to be arXiv links
-            self.logs[Warn.BIB] += [f"It appears you are using arXiv links more than you should ({arxiv_url_count}/{all_url_count}). Consider using ACL Anthology DOIs instead."]
+            self.report(Warn.BIB, f"It appears you are using arXiv links more than you should ({arxiv_url_count}/{all_url_count}). Consider using ACL Anthology DOIs instead.")
 
         if all_url_count < 5:
-            self.logs[Warn.BIB] += [f"It appears most of the references are not using paper links. Only {all_url_count} links found."]
+            self.report(Warn.BIB, f"It appears most of the references are not using paper links. Only {all_url_count} links found.")
 
         if arxiv_word_count > 10:
-            self.logs[Warn.BIB] += [f"It appears you are using arXiv references more than you should ({arxiv_word_count} found). Consider using ACL Anthology references instead."]
+            self.report(Warn.BIB, f"It appears you are using arXiv references more than you should ({arxiv_word_count} found). Consider using ACL Anthology references instead.")
 
         if not found_references:
-            self.logs[Warn.BIB] += ["Couldn't find any references."]
+            self.report(Warn.BIB, "Couldn't find any references.")
 
 
-args = None
-def worker(pdf_path, paper_type):
-    """ process one pdf """
-    return Formatter().format_check(submission=pdf_path, paper_type=paper_type)
+def add_check_arguments(parser):
+    """ Add the options of the checks, shared by the command line and the server, to parser. """
+    parser.add_argument('-p', '--paper_type', choices={"short", "long", "demo", "other"},
+                        default='long', help="")
+    parser.add_argument('--disable_name_check', action='store_true')
+    parser.add_argument('--disable_bottom_check', action='store_true')
+    parser.add_argument('--paper_timeout', type=float, default=None,
+                        help="maximum number of seconds spent checking one paper")
+    parser.add_argument('--page_timeout', type=float, default=None,
+                        help="maximum number of seconds spent checking one page")
+    parser.add_argument('--resolution', type=int, default=150,
+                        help="resolution (dpi) of the page renderings used by the margin check and the error images")
+    parser.add_argument('--annotations', choices={"full", "preview", "none"}, default="full",
+                        help="save the pages with errors as PNG images at full resolution, as small previews, or not at all")
+    parser.add_argument('--reference_backend', choices={"scholarcy", "local"}, default="scholarcy",
+                        help="extract the bibliography for the name check with the Scholarcy API or locally from the PDF")
+    parser.add_argument('--main_font_ratio', type=float, default=DEFAULT_MAIN_FONT_RATIO,
+                        help="minimum share of the characters that must use the main font")
+    parser.add_argument('--allowed_fonts', default=None,
+                        help="comma-separated names of the fonts allowed as the main font "
+                             "(default: Times and its common variants)")
+    parser.add_argument('--resident_pages', type=int, default=None,
+                        help="keep the layout of at most this many pages in memory, "
+                             "to bound the memory used by very long papers")
+    parser.add_argument('--cache_dir', default=None,
+                        help="reuse the results of previous runs stored in this directory, "
+                             "re-checking only the papers and pages that changed")
+    parser.add_argument('--profile', action='store_true',
+                        help="record the time and memory spent in each check and on each page")
+    parser.add_argument('--profile_dir', default=None,
+                        help="save a profile of each paper in this directory")
+    parser.add_argument('--profiler', choices={"cprofile", "pyinstrument"}, default="cprofile",
+                        help="the profiler used for --profile_dir (pyinstrument must be installed)")
+    parser.add_argument('--page_workers', type=int, default=1,
+                        help="split the pages of each paper across this many processes, to check a long "
+                             "paper sooner (ignored with --num_workers, which checks papers in parallel)")
+    parser.add_argument('--image_threads', type=int, default=1,
+                        help="threads encoding the images of the pages with errors while the next pages "
+                             "are checked (0: encode them in turn)")
+
+
+def config_from_args(args, **kwargs):
+    """ Return the batch configuration of the options added by add_check_arguments (and kwargs). """
+    from .batch import make_config
+    return make_config(paper_type=args.paper_type,
+                       disable_name_check=args.disable_name_check,
+                       disable_bottom_check=args.disable_bottom_check,
+                       paper_timeout=args.paper_timeout,
+                       page_timeout=args.page_timeout,
+                       resolution=args.resolution,
+                       annotations=args.annotations,
+                       reference_backend=args.reference_backend,
+                       cache_dir=args.cache_dir,
+                       main_font_ratio=args.main_font_ratio,
+                       allowed_fonts=args.allowed_fonts.split(',') if args.allowed_fonts else None,
+                       resident_pages=args.resident_pages,
+                       profile=args.profile,
+                       profile_dir=args.profile_dir,
+                       profiler=args.profiler,
+                       image_threads=args.image_threads,
+                       page_workers=args.page_workers,
+                       **kwargs)
 
 
 def main():
-    global args
     parser = argparse.ArgumentParser()
     parser.add_argument('submission_paths', metavar='file_or_dir', nargs='+',
                         default=[])
-    parser.add_argument('-p', '--paper_type', choices={"short", "long", "demo", "other"},
-                        default='long', help="")
+    add_check_arguments(parser)
     parser.add_argument('--num_workers', type=int, default=1)
-    parser.add_argument('--disable_name_check', action='store_false')
-    parser.add_argument('--disable_bottom_check', action='store_false')
+    parser.add_argument('--prefetch', type=int, default=4,
+                        help="number of papers (or chunks of papers) read ahead of the ones being checked")
+    parser.add_argument('--results_file', default=None,
+                        help="write the results of all papers to this file, one JSON record per paper "
+                             "(or one CSV row per problem if it ends with .csv), instead of printing "
+                             "a report and writing an errors-<paper>.json file for each paper")
+    parser.add_argument('--summary_file', default=None,
+                        help="write the aggregated results of all papers to this JSON file")
 
 
     args = parser.parse_args()
@@ -515,16 +822,17 @@ def main():
 
     if not fileset:
         print(f"No PDF files found in {paths}")
+        return
+
+    from .batch import run_batch, print_summary
+    config = config_from_args(args, results_file=args.results_file, prefetch=args.prefetch)
+    summary = run_batch(fileset, config, num_workers=args.num_workers)
 
-    if args.num_workers > 1:
-        from multiprocessing.pool import Pool
-        with Pool(args.num_workers) as p:
-            list(tqdm(p.imap(worker, fileset), total=len(fileset)))
-    else:
-        # TODO: make the tqdm togglable
-        #for submission in tqdm(fileset):
-        for submission in fileset:
-            worker(submission, args.paper_type)
+    if len(fileset) > 1:
+        print_summary(summary)
+    if args.summary_file:
+        with open(args.summary_file, 'w') as f:
+            json.dump(summary, f, indent=2)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,113 @@
+'''
+Index of the first-page headers of the camera-ready PDFs, for the metadata
+checks.
+
+The metadata checks compare the title and the authors of each submission
+with the beginning of the text of the first page of its PDF. Building the
+index extracts that header text from all the PDFs on a pool of worker
+processes, and caches it by the SHA-256 of each PDF, so that checking the
+metadata again after a few papers were fixed only reads the new PDFs.
+
+Only the top of the first page is turned into text: a band of the page,
+which grows until it holds the first max_chars characters of the page's
+text in complete lines. The text is the same as the beginning of the text
+of the whole page, which is much slower to extract on dense pages.
+'''
+
+import hashlib
+import json
+import os
+
+from .cache import default_cache_dir, file_hash
+
+
+# bump this when the extraction of the header changes
+HEADER_FORMAT = 1
+
+# the title and the authors are expected in the first 500 characters of the PDF
+DEFAULT_MAX_CHARS = 500
+
+
+def extract_header(pdf_path, max_chars=DEFAULT_MAX_CHARS, band=0.25):
+    """ Return the first max_chars characters of the text of the first page of a PDF. """
+    import pdfplumber
+    with pdfplumber.open(pdf_path) as pdf:
+        page = pdf.pages[0]
+        x0, top, x1, bottom = page.bbox
+        height = band * (bottom - top)
+        while top + height < bottom:
+            text = page.within_bbox((x0, top, x1, top + height)).extract_text()
+            # the last line of the band may be cut, so it must come after the header
+            if len(text) > max_chars and text[:max_chars].count("\n") < text.count("\n"):
+                return text[:max_chars]
+            height *= 2
+        return page.extract_text()[:max_chars]
+
+
+class HeaderCache(object):
+    """ Header texts stored under cache_dir, keyed by the SHA-256 of the PDF. """
+
+    def __init__(self, cache_dir=None):
+        self.headers_dir = os.path.join(cache_dir or default_cache_dir(), "headers")
+
+    def path(self, digest, max_chars):
+        key = hashlib.sha1(f"{HEADER_FORMAT} {digest} {max_chars}".encode()).hexdigest()
+        return os.path.join(self.headers_dir, key[:2], f"{key}.json")
+
+    def load(self, digest, max_chars):
+        try:
+            with open(self.path(digest, max_chars)) as f:
+                return json.load(f)["text"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def store(self, digest, max_chars, text):
+        path = self.path(digest, max_chars)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written to a temporary file first, so that a reader never sees a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"text": text}, f)
+        os.replace(tmp_path, path)
+
+
+def read_header(pdf_path, max_chars=DEFAULT_MAX_CHARS, cache_dir=None):
+    """
+    Return (pdf_path, header text, error): the header of a PDF, from the
+    cache if it was already extracted (cache_dir=False: no cache), or the
+    error that prevented its extraction; never raises.
+    """
+    try:
+        cache, digest = None, None
+        if cache_dir is not False:
+            cache = HeaderCache(cache_dir)
+            digest = file_hash(pdf_path)
+            text = cache.load(digest, max_chars)
+            if text is not None:
+                return pdf_path, text, None
+        text = extract_header(pdf_path, max_chars)
+        if cache is not None:
+            cache.store(digest, max_chars, text)
+        return pdf_path, text, None
+    except Exception as e:
+        # a one-line message, which fits in a cell of the problems sheet
+        return pdf_path, None, f"{type(e).__name__}: {e}"
+
+
+def _read_header(args):
+    return read_header(*args)
+
+
+def build_header_index(pdf_paths, max_chars=DEFAULT_MAX_CHARS, num_workers=1, cache_dir=None):
+    """
+    Return {pdf_path: (header text, error)} for all the PDFs, read on
+    num_workers processes; see read_header.
+    """
+    tasks = [(pdf_path, max_chars, cache_dir) for pdf_path in pdf_paths]
+    if num_workers > 1 and len(tasks) > 1:
+        from multiprocessing.pool import Pool
+        with Pool(num_workers) as pool:
+            entries = list(pool.imap_unordered(_read_header, tasks, chunksize=8))
+    else:
+        entries = [read_header(*task) for task in tasks]
+    return {pdf_path: (text, error) for pdf_path, text, error in entries}
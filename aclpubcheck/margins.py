@@ -0,0 +1,62 @@
+'''
+Vectorized detection of objects (words, images) that enter the page margins.
+
+The bounding boxes of all the objects of a page are loaded into NumPy arrays
+and the margin tests and the clipping to the visible area are computed as
+masks in one batch; only the surviving candidates are returned, so that the
+(expensive) pixel check runs on as few objects as possible.
+'''
+
+import numpy as np
+
+
+# 57 pixels (72ppi) = 2cm; 71 pixels (72ppi) = 2.5cm.
+TOP_MARGIN = 57
+SIDE_MARGIN = 71
+
+
+def find_margin_candidates(objects, page_width, page_height,
+                           left_offset, right_offset, top_offset,
+                           visible_only=False):
+    """
+    Return a list of (index, violation, bbox) for the objects that enter the
+    top, left or right margin, where violation is one of "top", "left",
+    "right" (tested in this order) and bbox is the visible area of the object
+    inside that margin.
+
+    Objects whose visible area is too small to be cropped are dropped. When
+    visible_only is set, objects that lie completely outside the page are
+    dropped as well.
+    """
+    if not objects:
+        return []
+
+    boxes = np.array([[o["x0"], o["top"], o["x1"], o["bottom"]] for o in objects], dtype=float)
+    x0, top, x1, bottom = boxes.T
+    # int() truncates towards zero
+    ix0, itop, ix1, ibottom = np.trunc(boxes).T
+
+    top_mask = (ibottom > 0) & (top < TOP_MARGIN - top_offset)
+    left_mask = ~top_mask & (ix1 > 0) & (x0 < SIDE_MARGIN - left_offset)
+    right_mask = ~top_mask & ~left_mask & (ix0 < page_width) & (page_width - x1 < SIDE_MARGIN - right_offset)
+    candidates = top_mask | left_mask | right_mask
+    if visible_only:
+        candidates &= (ix0 < page_width) & (ix1 >= 0) & (ibottom >= 0)
+
+    # get the actual visible area
+    cx0 = np.maximum(0, ix0)
+    # check the intersection with the right margin to handle larger images
+    # but with an "overflow" that is of the same color of the backgrond
+    cx0 = np.where(right_mask, np.maximum(cx0, page_width - SIDE_MARGIN + right_offset), cx0)
+    cx1 = np.minimum(ix1, page_width)
+    cx1 = np.where(left_mask, np.minimum(cx1, SIDE_MARGIN - right_offset), cx1)
+    cy0 = np.maximum(0, itop)
+    cy1 = np.minimum(ibottom, page_height)
+    cy1 = np.where(top_mask, np.minimum(cy1, TOP_MARGIN - top_offset), cy1)
+
+    # avoid problems in cropping images too small
+    candidates &= (cx1 - cx0 > 1) & (cy1 - cy0 > 1)
+
+    violations = np.where(top_mask, "top", np.where(left_mask, "left", "right"))
+    return [(int(k), str(violations[k]), (float(cx0[k]), float(cy0[k]), float(cx1[k]), float(cy1[k])))
+            for k in np.flatnonzero(candidates)]
@@ -1,76 +1,174 @@
 import argparse
 import collections
+import functools
 import itertools
 import os
 import os.path
 import regex as re
-import unicodedata
 import textwrap
 
 import pandas as pd
-import pdfplumber
 import unidecode
 
 from . import googletools
+from .headers import build_header_index
+from .normalize import normalize_text
+from .submissions import read_submissions
 
 
 def _clean_str(value):
-    if pd.isna(value):
+    # cells that are not strings may be missing values
+    if not isinstance(value, str) and pd.isna(value):
         return ''
-    # uncurl all quotes
-    value = re.sub(r'[\u2018\u2019]', "'", value)
-    value = re.sub(r'[\u201C\u201D]', '"', value)
-    # use simple dashes
-    value = re.sub(r'[\u2013\u2014]', "-", value)
-    # not exactly sure why, but this has to be done iteratively
-    old_value = None
-    value = value.strip()
-    while old_value != value:
-        old_value = value
-        # strip space before accent; PDF seems to introduce these
-        value = re.sub(r'\p{Zs}+(\p{Mn})', r'\1', value)
-        # combine accents with characters
-        value = unicodedata.normalize('NFKC', value)
-    return value
+    return normalize_text(value)
+
+
+# characters that may differ between the names of the metadata and the PDF
+ALLOWED_CHARS = r'[\p{Zs}\p{p}\p{Mn}]'
+_ALLOWED_CHARS_RE = re.compile(ALLOWED_CHARS)
+# the same characters, once the text is transliterated to ASCII by unidecode
+_ASCII_ALLOWED_CHARS = frozenset(
+    c for c in map(chr, range(128)) if _ALLOWED_CHARS_RE.match(c))
+_TITLE_IGNORED_RE = re.compile(r'[\s{}$^]')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def fold_case(text):
+    """
+    Case-fold text character by character, keeping its length (as the
+    case-insensitive matching of regular expressions does).
+    """
+    return ''.join(folded if len(folded := c.casefold()) == 1 else c.lower()
+                   for c in text)
+
+
+def fold_name(part):
+    """
+    Split a name between the allowed characters, and transliterate each
+    piece to ASCII as a tuple of units, the lowercased transliterations of
+    its characters. The characters of a unit must be contiguous in the text
+    (unidecode turns one character into them), but allowed characters may
+    separate the units.
+    """
+    pieces = []
+    for piece in _ALLOWED_CHARS_RE.split(part):
+        units = (''.join(c for c in unidecode.unidecode(char)
+                         if c not in _ASCII_ALLOWED_CHARS).lower()
+                 for char in piece)
+        pieces.append(tuple(unit for unit in units if unit))
+    return pieces
+
+
+class HeaderText(object):
+    """
+    The header text of a PDF, with the normalized forms that the author and
+    title checks search, each computed once. The searches scan these forms
+    for the names or the title, without the backtracking of the regular
+    expressions they replace, however many authors a paper has.
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+    @functools.cached_property
+    def folded(self):
+        """
+        The text transliterated to ASCII, lowercased and without the allowed
+        characters, and the offset in the transliteration of each character.
+        """
+        ascii_text = unidecode.unidecode(self.text)
+        offsets = [i for i, c in enumerate(ascii_text)
+                   if c not in _ASCII_ALLOWED_CHARS]
+        return ''.join(ascii_text[i] for i in offsets).lower(), offsets
+
+    @functools.cached_property
+    def compact(self):
+        """ The text without whitespace, case-folded. """
+        return fold_case(_SPACES_RE.sub('', self.text))
+
+    def find_names(self, names):
+        """
+        Return the span of the text containing the names in order, or None.
+        Taking the first occurrence of each name after the previous one
+        finds such a span if there is one.
+        """
+        start, end = None, 0
+        for name in names:
+            position = self.text.find(name, end)
+            if position < 0:
+                return None
+            if start is None:
+                start = position
+            end = position + len(name)
+        return start or 0, end
+
+    def find_folded_names(self, pieces):
+        """
+        Return the span of the ASCII transliteration of the text containing
+        the pieces of names (see fold_name) in order, ignoring case and the
+        allowed characters, or None.
+        """
+        folded, offsets = self.folded
+        start, end = None, 0
+        for units in pieces:
+            needle = ''.join(units)
+            position = folded.find(needle, end)
+            while position >= 0 and not self._contiguous(units, position):
+                position = folded.find(needle, position + 1)
+            if position < 0:
+                return None
+            if start is None:
+                # a name starting with an allowed character matches from
+                # the beginning of the text
+                start = offsets[position] if needle else 0
+            if needle:
+                end = position + len(needle)
+        return start or 0, offsets[end - 1] + 1 if end > 0 else 0
+
+    def _contiguous(self, units, position):
+        """ Whether the characters of each unit found at position are contiguous in the transliteration. """
+        offsets = self.folded[1]
+        for unit in units:
+            for i in range(position, position + len(unit) - 1):
+                if offsets[i + 1] != offsets[i] + 1:
+                    return False
+            position += len(unit)
+        return True
 
 
 def yield_author_problems(names, text):
+    if not isinstance(text, HeaderText):
+        text = HeaderText(text)
     # check for author names in the expected order, allowing for
     # punctuation, affiliations, etc. between names
     # NOTE: only removed or re-ordered (not added) authors will be caught
-    match = re.search('.*?'.join(names), text, re.DOTALL)
-    if not match:
+    if text.find_names(names) is None:
 
         # check if there is a match when ignoring case, punctuation, accents
         # since this is the most common type of error
-        allowed_chars = r'[\p{Zs}\p{p}\p{Mn}]'
-        match_ignoring_case_punct_accent = re.search(
-            '.*?'.join(
-                fr'{allowed_chars}*'.join(unidecode.unidecode(c) for c in p)
-                for part in names for p in re.split(allowed_chars, part)),
-            unidecode.unidecode(text),
-            re.DOTALL | re.IGNORECASE)
-        if match_ignoring_case_punct_accent:
+        span = text.find_folded_names(
+            [piece for part in names for piece in fold_name(part)])
+        if span is not None:
             problem = 'AUTHOR-MISMATCH-CASE-PUNCT-ACCENT'
             # these offsets may be slightly incorrect because unidecode may
             # change the number of characters, but it should be close enough
-            start, end = match_ignoring_case_punct_accent.span()
-            in_text = text[start: end]
+            start, end = span
+            in_text = text.text[start: end]
         else:
             problem = 'AUTHOR-MISMATCH'
-            in_text = text
+            in_text = text.text
         yield problem, f"meta=\"{' '.join(names)}\"\npdf =\"{in_text}\""
 
 
 def yield_title_problems(title, text):
+    if not isinstance(text, HeaderText):
+        text = HeaderText(text)
     # ignore spaces and some LaTeX-isms
-    title_chars = re.sub(r'[\s{}$^]', '', title.replace('--', '-'))
-    title_regex = r'\s*'.join(re.escape(c) for c in title_chars)
+    title_chars = _TITLE_IGNORED_RE.sub('', title.replace('--', '-'))
 
     # ignore differences in case; LaTeX \sc comes out as caps in PDF
-    match = re.search(title_regex, text, re.IGNORECASE)
-    if not match:
-        yield 'TITLE', f"meta=\"{title}\"\npdf =\"{text}\""
+    if fold_case(title_chars) not in text.compact:
+        yield 'TITLE', f"meta=\"{title}\"\npdf =\"{text.text}\""
 
 
 def yield_copyright_problems(signature, org_name, org_address):
@@ -102,7 +200,9 @@ def check_metadata(
         sheet_id,
         id_column,
         problem_column,
-        post=False):
+        post=False,
+        num_workers=1,
+        cache_dir=None):
 
     # map submission IDs to PDF paths
     id_to_pdf = {}
@@ -115,40 +215,46 @@ def check_metadata(
     id_to_sheet_row = {}
     problems = collections.defaultdict(lambda: collections.defaultdict(list))
 
-    df = pd.read_csv(submissions_path, keep_default_na=False)
-    for index, row in df.iterrows():
-        submission_id = row["Submission ID"]
-        title = _clean_str(row["Title"])
+    submissions = list(read_submissions(submissions_path))
 
-        # NOTE: These were the names in the custom final submission form
-        # for NAACL 2021. Names and structure may be different depending
-        # on your final submission form.
-        signature = _clean_str(row["copyrightSig"])
-        org_name = _clean_str(row["orgName"])
-        org_address = _clean_str(row["orgAddress"])
+    # extract the first-page headers of all the PDFs up front, in parallel
+    # and from the cache for the PDFs that did not change since the last run
+    headers = build_header_index(
+        [id_to_pdf[submission.id] for submission in submissions],
+        num_workers=num_workers, cache_dir=cache_dir)
 
-        # row in the spreadsheet is 1-based and first row is the header
-        id_to_sheet_row[submission_id] = index + 2
+    for submission in submissions:
+        submission_id = submission.id
+        title = _clean_str(submission.title)
+        signature = _clean_str(submission.signature)
+        org_name = _clean_str(submission.org_name)
+        org_address = _clean_str(submission.org_address)
 
-        # open the PDF
-        pdf_path = id_to_pdf[submission_id]
-        pdf = pdfplumber.open(pdf_path)
+        # row in the spreadsheet is 1-based and first row is the header
+        id_to_sheet_row[submission_id] = submission.row + 2
 
         # assumes metadata can be found in the first 500 characters
-        text = _clean_str(pdf.pages[0].extract_text()[:500])
+        header, error = headers[id_to_pdf[submission_id]]
+        text = HeaderText(_clean_str(header))
 
-        # collect all authors and their affiliations
+        # collect all authors
         names = []
-        for i in range(1, 25):
-            for x in ['First', 'Middle', 'Last']:
-                name_part = _clean_str(row[f'{i}: {x} Name'])
+        for author in submission.authors:
+            for name_part in author.name_parts:
+                name_part = _clean_str(name_part)
                 if name_part:
                     names.extend(name_part.split())
 
-        # collect all problems
-        for problem_type, problem_text in itertools.chain(
+        # collect all problems; the title and authors cannot be checked
+        # against a PDF that cannot be read
+        if error is not None:
+            text_problems = [('PDF', f"cannot read {id_to_pdf[submission_id]}: {error}")]
+        else:
+            text_problems = itertools.chain(
                 yield_author_problems(names, text),
-                yield_title_problems(title, text),
+                yield_title_problems(title, text))
+        for problem_type, problem_text in itertools.chain(
+                text_problems,
                 yield_copyright_problems(signature, org_name, org_address)):
             problems[submission_id][problem_type].append(problem_text)
 
@@ -212,5 +318,11 @@ if __name__ == "__main__":
     parser.add_argument('--sheet-id', default='Sheet1')
     parser.add_argument('--id-column', default='A')
     parser.add_argument('--problem-column', default='E')
+    parser.add_argument('--num-workers', type=int, default=os.cpu_count(),
+                        help='processes extracting the headers of the PDFs')
+    parser.add_argument('--cache-dir', default=None,
+                        help='where the headers of the PDFs are cached')
+    parser.add_argument('--no-cache', dest='cache_dir', action='store_const',
+                        const=False, help='extract all the headers again')
     args = parser.parse_args()
     check_metadata(**vars(args))
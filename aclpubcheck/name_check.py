@@ -1,66 +1,117 @@
-import os
+from collections import namedtuple
+from functools import lru_cache
 import rebiber
 from pylatexenc.latex2text import LatexNodes2Text
-from pybtex.database import parse_file
-import contextlib
+from pybtex.database import BibliographyData, parse_string
 from unidecode import unidecode
 import re
 
 
+from .bibdb import load_bib_db
+from .references import LocalExtractor, ScholarcyExtractor
+
+
+# reference-extraction backends, selected with the "backend" option of the config
+BACKENDS = {
+    'scholarcy': ScholarcyExtractor,
+    'local': LocalExtractor,
+}
+
+
+# one LaTeX-to-text converter shared by all names and titles
+_latex = LatexNodes2Text()
+
+
+@lru_cache(maxsize=65536)
+def latex_to_text(value):
+    return _latex.latex_to_text(value)
+
+
+@lru_cache(maxsize=65536)
+def name_key(value):
+    '''
+    Canonical form of a name: lowercase, without spaces, punctuation and accents
+    '''
+    return unidecode(re.sub(r'\W+', '', value.lower()))
+
+
+# The canonical keys of an author name (a list of name parts), so that
+# comparing two names is a comparison of precomputed strings
+AuthorKeys = namedtuple('AuthorKeys', ['whole', 'first', 'first_initials', 'first_is_initial', 'last'])
+
+
+def author_keys(name):
+    first = name[0] if name else ''
+    last = name[-1] if name else ''
+    return AuthorKeys(
+        whole=name_key(''.join(name)),
+        first=name_key(first),
+        first_initials=name_key(re.sub(r'[^A-Z]', '', first)),
+        first_is_initial=re.search(r'^[A-Z]\.', first) is not None,
+        last=name_key(last))
+
+
+_ENTRY_START_RE = re.compile(r'^(?=\s*@)', re.MULTILINE)
+_ENTRY_KEY_RE = re.compile(r'\s*@\w+\s*[{(]\s*([^,\s]*)')
+
+
+def deduplicate_entries(bib_text):
+    """ Drop the entries of a BibTeX text whose key was already used (pybtex rejects them). """
+    keys = set()
+    chunks = []
+    for chunk in _ENTRY_START_RE.split(bib_text):
+        match = _ENTRY_KEY_RE.match(chunk)
+        if match:
+            if match.group(1) in keys:
+                continue
+            keys.add(match.group(1))
+        chunks.append(chunk)
+    return ''.join(chunks)
+
+
 class PDFNameCheck:
 
     def __init__(self):
-        # Generate and update the bib list from various conferences
-        filepath = os.path.abspath(rebiber.__file__).replace("__init__.py", "")
-        bib_list_path = os.path.join(filepath, "bib_list.txt")
-        with open(os.devnull, "w") as f, contextlib.redirect_stdout(f):
-            self.bib_db = rebiber.construct_bib_db(
-                bib_list_path, start_dir=filepath)
-
-    def execute_curl(self, config):
-        # The curl string to convert the PDF to bib.
-        # I have used scholarcy API here.
-        # See the link here: https://ref.scholarcy.com/api/
-        # I used the POST curl for download
-
-        self.filename = config.file.split('.')[0]
-        temp_name = self.filename.split('/')[-1]
-        os.makedirs('temp', exist_ok=True)
-
-        curl_string = 'curl --silent -X \'POST\'' \
-            ' \'https://ref.scholarcy.com/api/references/download\'' \
-            ' -H \'accept: application/json\'' \
-            ' -H \'Authorization: Bearer \'' \
-            ' -H \'Content-Type: multipart/form-data\'' \
-            f' -F \'file=@{config.file};type=application/pdf\'' \
-            ' -F \'document_type=full_paper\'' \
-            f' -F \'references={config.ref_string}\'' \
-            f' -F \'reference_style={config.mode}\'' \
-            ' -F \'reference_format=bibtex\'' \
-            ' -F \'parser=v2\'' \
-            f' -F \'engine=v1\' > temp/before-rebiber-{temp_name}.bib'
-
-        # Execute that curl string
-        with open(os.devnull, "w") as f, contextlib.redirect_stdout(f):
-            os.system(curl_string)
-
-    def apply_rebiber(self):
-        # The curl string generates a bib file called 'before rebiber'
-        # Pass it to rebiber
-        temp_name = self.filename.split('/')[-1]
-        all_bib_entries = rebiber.load_bib_file(f'temp/before-rebiber-{temp_name}.bib')
-
-        # Update the bib file using rebiber and call it 'after rebiber'
-        with open(os.devnull, "w") as f, contextlib.redirect_stdout(f):
-            rebiber.normalize_bib(
-                self.bib_db, all_bib_entries, f'temp/after-rebiber-{temp_name}.bib')
-
-    def extract_names(self):
-        # Parse both bib files
-        temp_name = self.filename.split('/')[-1]
-        old_bib_data = parse_file(f'temp/before-rebiber-{temp_name}.bib')
-        new_bib_data = parse_file(f'temp/after-rebiber-{temp_name}.bib')
+        # backends are created on first use, e.g., to open a single HTTP session
+        self.extractors = {}
+
+    @property
+    def bib_db(self):
+        # The bib list from various conferences is built once per process
+        # (and cached on disk), the first time it is needed
+        return load_bib_db()
+
+    def extract_references(self, config, pages=None):
+        # Convert the PDF to bib with the configured backend
+        # (by default the scholarcy API: https://ref.scholarcy.com/api/)
+        backend = getattr(config, 'backend', 'scholarcy')
+        if backend not in self.extractors:
+            self.extractors[backend] = BACKENDS[backend]()
+        return self.extractors[backend].extract(config.file, pages, config)
+
+    def apply_rebiber(self, bib_text):
+        # Update the extracted bib entries ('before rebiber') with the
+        # official ones found by rebiber ('after rebiber'), matching them by
+        # normalized title as rebiber.normalize_bib does, but in memory; as
+        # there, the entries without a title are skipped and only the first
+        # entry of a repeated key is kept
+        bib_text = deduplicate_entries(bib_text)
+        old_bib_data = parse_string(bib_text, 'bibtex')
+        new_bib_data = BibliographyData()
+        for key, entry in parse_string(bib_text, 'bibtex').entries.items():
+            if 'title' not in entry.fields:
+                continue
+            title = rebiber.normalize.normalize_title(entry.fields['title'])
+            if title and title in self.bib_db:
+                try:
+                    official = parse_string(''.join(self.bib_db[title]), 'bibtex')
+                    entry = next(iter(official.entries.values()))
+                except Exception:
+                    pass
+            new_bib_data.add_entry(key, entry)
+        return old_bib_data, new_bib_data
 
+    def extract_names(self, old_bib_data, new_bib_data):
         name_list = {}
 
         paper_keys = list(new_bib_data.entries.keys())
@@ -92,8 +143,7 @@ class PDFNameCheck:
                         # Bugfix: Sometimes there are two names in a name
                         if old_key[i].last_names == new_key[i].bibtex_first_names + new_key[i].last_names:
                             additional = i
-                        new_name = [LatexNodes2Text().latex_to_text(name)
-                                    for name in new_name]
+                        new_name = [latex_to_text(name) for name in new_name]
                         old_paper_authors.append(old_name)
                         new_paper_authors.append(new_name)
                     else:
@@ -111,8 +161,11 @@ class PDFNameCheck:
                 name_list[paper] = {}
                 name_list[paper]['old'] = old_paper_authors
                 name_list[paper]['new'] = new_paper_authors
-                name_list[paper]['title'] = LatexNodes2Text().latex_to_text(
+                name_list[paper]['title'] = latex_to_text(
                     new_bib_data.entries[paper].fields['title'])
+                # canonical keys, computed once per author of the entry
+                name_list[paper]['old_keys'] = [author_keys(name) for name in old_paper_authors]
+                name_list[paper]['new_keys'] = [author_keys(name) for name in new_paper_authors]
 
                 if 'url' in new_bib_data.entries[paper].fields:
                     name_list[paper]['url'] = new_bib_data.entries[paper].fields['url']
@@ -123,16 +176,7 @@ class PDFNameCheck:
         '''
         Do a basic cleanup to tell whether the names are same or not
         '''
-        # remove spaces and lowercase
-        string_a = ('').join(string_a).lower()
-        string_b = ('').join(string_b).lower()
-        # remove punctuations
-        string_a = re.sub(r'\W+', '', string_a)
-        string_b = re.sub(r'\W+', '', string_b)
-        # remove accents
-        string_a = unidecode(string_a)
-        string_b = unidecode(string_b)
-        return string_a == string_b
+        return name_key(('').join(string_a)) == name_key(('').join(string_b))
 
     def compare_changes(self, name_list, config):
 
@@ -143,6 +187,8 @@ class PDFNameCheck:
             output_strings = []
             old = name_list[paper]['old']
             new = name_list[paper]['new']
+            old_keys = name_list[paper].get('old_keys') or [author_keys(name) for name in old]
+            new_keys = name_list[paper].get('new_keys') or [author_keys(name) for name in new]
             title = name_list[paper]['title']
             if 'url' in name_list[paper]:
                 url = name_list[paper]['url']
@@ -166,7 +212,7 @@ class PDFNameCheck:
                     # If you wanna check the full name
                     if config.whole_name:
                         # Check if names are sanme
-                        if self.if_equal(old[i], new[i]) is False:
+                        if old_keys[i].whole != new_keys[i].whole:
                             # If not, check if we have warned them already
                             if already_warned is False:
                                 error_count += 1
@@ -186,15 +232,13 @@ class PDFNameCheck:
                         # If you wanna check only the first name
                         if config.first_name:
                             if config.initials and \
-                                    (re.search(r'^[A-Z]\.', old[i][0]) or re.search(r'^[A-Z]\.', new[i][0])):
-                                old_first_name = re.sub(
-                                    r'[^A-Z]', '', old[i][0])
-                                new_first_name = re.sub(
-                                    r'[^A-Z]', '', new[i][0])
+                                    (old_keys[i].first_is_initial or new_keys[i].first_is_initial):
+                                old_first_name = old_keys[i].first_initials
+                                new_first_name = new_keys[i].first_initials
                             else:
-                                old_first_name = old[i][0]
-                                new_first_name = new[i][0]
-                            if self.if_equal(old_first_name, new_first_name) is False:
+                                old_first_name = old_keys[i].first
+                                new_first_name = new_keys[i].first
+                            if old_first_name != new_first_name:
                                 if already_warned is False:
                                     error_count += 1
                                     output_strings.append(
@@ -213,7 +257,7 @@ class PDFNameCheck:
                                         f'The author #{first_author_id} name should be {new_name} not {old_name}.')
                         # If you wanna check only the last name
                         if config.last_name:
-                            if self.if_equal(old[i][-1], new[i][-1]) is False:
+                            if old_keys[i].last != new_keys[i].last:
                                 if already_warned is False:
                                     error_count += 1
                                     output_strings.append(
@@ -237,9 +281,9 @@ class PDFNameCheck:
 
         return warnings
 
-    def execute(self, config):
-        self.execute_curl(config)
-        self.apply_rebiber()
-        name_list = self.extract_names()
+    def execute(self, config, pages=None):
+        bib_text = self.extract_references(config, pages)
+        old_bib_data, new_bib_data = self.apply_rebiber(bib_text)
+        name_list = self.extract_names(old_bib_data, new_bib_data)
         output_strings = self.compare_changes(name_list, config)
         return output_strings
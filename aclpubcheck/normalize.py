@@ -0,0 +1,43 @@
+'''
+Normalization of the texts compared by the metadata checks: the cells of
+the submission spreadsheet and the headers of the PDFs.
+
+The same values come up again and again (empty cells, affiliations shared
+by many authors, common first names), so the normalized values are cached.
+'''
+
+import functools
+import unicodedata
+
+import regex as re
+
+
+# curly quotes and long dashes, replaced by their ASCII forms
+_PUNCTUATION = str.maketrans({
+    '‘': "'", '’': "'",
+    '“': '"', '”': '"',
+    '–': '-', '—': '-',
+})
+
+# spaces before an accent; PDF seems to introduce these
+_SPACE_BEFORE_ACCENT_RE = re.compile(r'\p{Zs}+(\p{Mn})')
+
+
+@functools.lru_cache(maxsize=65536)
+def normalize_text(value):
+    """
+    Return value with ASCII quotes and dashes, without surrounding
+    whitespace nor spaces before accents, and NFKC-normalized, so that the
+    accents are combined with their characters.
+    """
+    value = value.translate(_PUNCTUATION).strip()
+    if value.isascii():
+        # neither accents nor compatibility characters
+        return value
+    value = unicodedata.normalize('NFKC', _SPACE_BEFORE_ACCENT_RE.sub(r'\1', value))
+    # NFKC decomposes the spacing accents (e.g. U+00B4) into a space and a
+    # combining accent; once these spaces are stripped too, composing the
+    # accents cannot leave a space before an accent, so this is final
+    if _SPACE_BEFORE_ACCENT_RE.search(value):
+        value = unicodedata.normalize('NFKC', _SPACE_BEFORE_ACCENT_RE.sub(r'\1', value))
+    return value
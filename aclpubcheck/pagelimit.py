@@ -0,0 +1,73 @@
+'''
+Early-exit search for the sections that may run past the page limit.
+
+The page limit is exceeded when the first line mentioning one of the
+SECTION_MARKERS (References, Acknowledgments, Limitations, ...) comes after
+the first line of the page following the limit. Deciding this does not need
+the text of every page: a marker anywhere before that line settles the
+check, and otherwise only the first marker after it matters.
+
+The pages are therefore visited from the most likely position of the
+marker, guessed from the headings of the pages (runs of bold or larger
+characters, which only need the characters of the page, not the layout of
+its text), and the search stops at the first decisive marker; the text of
+the other pages is never extracted.
+'''
+
+from collections import Counter
+
+
+SECTION_MARKERS = {"References", "Acknowledgments", "Acknowledgement", "Acknowledgment",
+                   "EthicsStatement", "EthicalConsiderations", "Ethicalconsiderations",
+                   "BroaderImpact", "EthicalConcerns", "EthicalStatement", "EthicalDeclaration",
+                   "Limitations", "Limitation"}
+
+# fragments of the names of bold fonts (e.g., NimbusRomNo9L-Medi, TeXGyreTermesX-Bold, CMBX10)
+BOLD_FONTS = ("Bold", "Medi", "Semibold", "Black", "Heavy", "CMBX")
+
+
+def is_bold(fontname):
+    return any(fragment in fontname for fragment in BOLD_FONTS)
+
+
+def heading_texts(chars):
+    """
+    Return the text (without spaces) of the runs of bold or larger than usual
+    characters of a page, in the order they appear.
+    """
+    if not chars:
+        return []
+    body_size = Counter(round(c["size"], 1) for c in chars).most_common(1)[0][0]
+
+    runs = []
+    last = None
+    for c in chars:
+        heading = is_bold(c["fontname"]) or round(c["size"], 1) > body_size + 0.5
+        key = (round(c["top"]), c["fontname"], round(c["size"], 1))
+        if heading and key == last:
+            runs[-1].append(c["text"])
+        elif heading:
+            runs.append([c["text"]])
+        last = key if heading else None
+    return [''.join(run).replace(' ', '') for run in runs]
+
+
+def has_marker(text):
+    return any(marker in text for marker in SECTION_MARKERS)
+
+
+def first_marker_line(lines, start=0, stop=None):
+    """ Return the 0-based index of the first of lines[start:stop] mentioning a marker, or None. """
+    for j, line in enumerate(lines[start:stop], start):
+        if has_marker(line):
+            return j
+    return None
+
+
+def search_order(num_pages, limit, guess):
+    """
+    Return the (1-based) pages up to limit+1 in the order they are searched:
+    outwards from the guessed page, preferring the earlier page on ties.
+    """
+    pages = range(1, min(limit + 1, num_pages) + 1)
+    return sorted(pages, key=lambda n: (abs(n - guess), n))
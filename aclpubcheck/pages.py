@@ -0,0 +1,341 @@
+'''
+Per-paper page model shared by the Formatter checks.
+
+Each page of a submission is wrapped in a PageRecord that extracts what the
+checks need (chars, words with colors, images, hyperlinks, text lines) at
+most once. The checks read from these records instead of walking
+pdfplumber's pages on their own, so pdfminer's layout analysis and the text
+extraction are not repeated for every check.
+
+All the work done on a page runs under the paper's Budget: a page that runs
+out of time is marked as timed out, and any later access to it (or to any
+page once the whole paper is out of time) raises a BudgetExceeded error that
+the checks treat as "skip this page".
+
+With a ResultCache, the JSON-serializable results of a page (its text, font
+counts, link URIs and the results of the checks that store them) are also
+kept across runs, keyed by a fingerprint of the page's content, so that an
+unchanged page is not analyzed again.
+
+By default, the layout of every page stays in memory until the paper is
+closed. With resident_pages=N, PaperPages streams the pages instead: at most
+N pages keep their layout (pdfplumber's objects and the chars, words and
+images extracted from them) and, when another page is opened, the least
+recently used one computes its summaries (e.g., font counts, headings, text)
+and releases its layout. A worker checking a paper then holds at most
+
+    N * (layout of the largest page) + summaries of all pages
+    + pdfminer's cache of the document's shared objects (fonts, images)
+
+which does not grow with the number of pages beyond the summaries (mostly
+the text of the pages). A page whose layout is needed again after it was
+released is parsed again: the result is the same, only slower.
+
+The pages of a paper can also be split across page workers (processes that
+run the page-local work of the checks on a part of the pages, see
+Formatter.check_pages). A worker iterates over its selection of the pages
+only, and exports the results of each page (the JSON-serializable results
+that would be cached, and the error image it saved); the process checking
+the whole paper preloads them in its PageRecords, which then behave as if
+these results had been read from the cache.
+'''
+
+from collections import Counter, OrderedDict
+
+from contextlib import contextmanager, nullcontext
+import time
+
+from .budget import Budget, PageTimeout
+from .fonts import resource_fonts
+from .pagelimit import heading_texts
+
+
+class PageRecord(object):
+    """ Cached extraction results for a single pdfplumber page. """
+
+    def __init__(self, page, budget=None, cache=None, hasher=None, profiler=None):
+        self.page = page
+        self.index = page.page_number - 1
+        self.width = page.width
+        self.height = page.height
+        self.budget = budget if budget is not None else Budget()
+        self.elapsed = 0.0  # seconds spent working on this page
+        self._guard_depth = 0  # guards of this page running (see guard)
+        self.timed_out = False
+        # name -> (value, exception); failures are cached too, so a page
+        # that cannot be parsed is not re-parsed by every check
+        self._cache = {}
+        # results stored across runs (see cached and store)
+        self.result_cache = cache
+        self._hasher = hasher
+        self._fingerprint = None
+        self._stored = None
+        self._dirty = False
+        # results of the page computed in this run (or preloaded from a page
+        # worker): name -> JSON-serializable value, see cached and store
+        self.results = {}
+        # the name of the error image of the page, if a page worker saved it
+        self.saved_image = None
+        # records the time and memory spent on the page (None: not profiled)
+        self.profiler = profiler
+
+    # the extraction results that hold the page's layout, released by flush
+    LAYOUT = ("chars", "words", "images", "hyperlinks")
+
+    @contextmanager
+    def guard(self):
+        """ Run some work on this page within its remaining time budget. """
+        if self.timed_out:
+            raise PageTimeout(f"page {self.index+1} already exceeded its budget")
+        if self._guard_depth:
+            # nested in a guard of this page (e.g., lines reads text), which
+            # already bounds, times and profiles the work
+            yield
+            return
+        page_remaining = None
+        if self.budget.page_timeout is not None:
+            page_remaining = self.budget.page_timeout - self.elapsed
+        start = time.monotonic()
+        self._guard_depth += 1
+        try:
+            with self.measure(), self.budget.guard(page_remaining):
+                yield
+        except PageTimeout:
+            self.timed_out = True
+            raise
+        finally:
+            self._guard_depth -= 1
+            self.elapsed += time.monotonic() - start
+
+    @property
+    def fingerprint(self):
+        """ Fingerprint of the page's content, or None if results are not cached. """
+        if self.result_cache is not None and self._fingerprint is None:
+            from .cache import page_fingerprint
+            try:
+                with self.guard():
+                    self._fingerprint = page_fingerprint(self.page, self._hasher)
+            except PageTimeout:
+                raise
+            except Exception:
+                # a page that cannot be fingerprinted is simply not cached
+                self.result_cache = None
+        return self._fingerprint
+
+    def cached(self, name):
+        """ Return the result computed for this page in this run (or a previous one, if cached), or None. """
+        if name in self.results:
+            return self.results[name]
+        if self.fingerprint is None:
+            return None
+        if self._stored is None:
+            self._stored = self.result_cache.load_page(self.fingerprint)
+        return self._stored.get(name)
+
+    def store(self, name, value):
+        """ Store a JSON-serializable result of this page for later checks and runs. """
+        self.results[name] = value
+        if self.fingerprint is None:
+            return
+        if self._stored is None:
+            self._stored = self.result_cache.load_page(self.fingerprint)
+        self._stored[name] = value
+        self._dirty = True
+
+    def save(self):
+        """ Write the results stored for this page to the cache. """
+        if self._dirty:
+            self.result_cache.store_page(self.fingerprint, self._stored)
+            self._dirty = False
+
+    def measure(self):
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.measure(self.profiler.pages, self.index+1)
+
+    def count(self, name):
+        """ Count an expensive operation on the page, when profiling. """
+        if self.profiler is not None:
+            self.profiler.count(name)
+
+    def export(self):
+        """ Return what a page worker computed for this page, for preload. """
+        return {'results': self.results, 'timed_out': self.timed_out, 'saved_image': self.saved_image}
+
+    def preload(self, exported):
+        """ Use the results that a page worker computed for this page. """
+        self.results.update(exported['results'])
+        self.timed_out = self.timed_out or exported['timed_out']
+        self.saved_image = exported['saved_image']
+
+    def has_layout(self):
+        """ Return True if the page's layout was extracted and not released since. """
+        return any(name in self.LAYOUT or isinstance(name, tuple) for name in self._cache)
+
+    def flush(self, summaries=()):
+        """
+        Release the page's layout, after computing the summaries (names of
+        properties, e.g., "font_counts") that are still needed from it.
+        """
+        if self.has_layout():
+            self.summarize(summaries)
+        for name in list(self._cache):
+            if name in self.LAYOUT or isinstance(name, tuple):
+                del self._cache[name]
+        self.page.close()
+
+    def summarize(self, summaries):
+        """ Compute the summaries (names of properties, e.g., "font_counts") of the page. """
+        for name in summaries:
+            try:
+                getattr(self, name)
+            except Exception:
+                # failures are cached, and reported by the check that needs the summary
+                pass
+
+    def _extract(self, name, fn, persistent=False):
+        if name not in self._cache:
+            value = self.cached(name) if persistent else None
+            if value is not None:
+                self._cache[name] = (value, None)
+                return value
+            try:
+                with self.guard():
+                    value = fn()
+                self._cache[name] = (value, None)
+                if persistent:
+                    self.store(name, value)
+            except Exception as e:
+                self._cache[name] = (None, e)
+        value, error = self._cache[name]
+        if error is not None:
+            raise error
+        return value
+
+    @property
+    def chars(self):
+        return self._extract("chars", lambda: self.page.chars)
+
+    @property
+    def words(self):
+        return self._extract("words", lambda: self._extract_words(
+            extra_attrs=["non_stroking_color", "stroking_color"]))
+
+    def extract_words(self, **kwargs):
+        """ Words extracted with non-default (hashable) pdfplumber options, cached per options. """
+        key = ("words",) + tuple(sorted(kwargs.items()))
+        return self._extract(key, lambda: self._extract_words(**kwargs))
+
+    def _extract_words(self, **kwargs):
+        self.count("extract_words")
+        return self.page.extract_words(**kwargs)
+
+    @property
+    def images(self):
+        return self._extract("images", lambda: self.page.images)
+
+    @property
+    def hyperlinks(self):
+        return self._extract("hyperlinks", lambda: self.page.hyperlinks)
+
+    @property
+    def uris(self):
+        """ The URIs of the page's hyperlinks. """
+        return self._extract("uris", lambda: [h['uri'] for h in self.hyperlinks], persistent=True)
+
+    @property
+    def font_counts(self):
+        """ Number of characters of the page for each font name. """
+        return self._extract("font_counts", lambda: dict(Counter(char['fontname'] for char in self.chars)), persistent=True)
+
+    @property
+    def headings(self):
+        """ The text of the runs of bold or larger characters of the page. """
+        return self._extract("headings", lambda: heading_texts(self.chars), persistent=True)
+
+    @property
+    def declared_fonts(self):
+        """ The names of the fonts declared in the page's resources (whether they are used or not). """
+        return self._extract("declared_fonts", lambda: sorted(resource_fonts(self.page.page_obj.resources)), persistent=True)
+
+    @property
+    def text(self):
+        return self._extract("text", self._extract_text, persistent=True)
+
+    def _extract_text(self):
+        self.count("extract_text")
+        return self.page.extract_text()
+
+    @property
+    def lines(self):
+        return self._extract("lines", lambda: self.text.split('\n'))
+
+    def crop(self, bbox):
+        return self.page.crop(bbox)
+
+    def to_image(self, **kwargs):
+        return self.page.to_image(**kwargs)
+
+
+class PaperPages(object):
+    """ Lazily built list of PageRecords for an open pdfplumber PDF. """
+
+    def __init__(self, pdf, budget=None, cache=None, resident_pages=None, summaries=(), profiler=None,
+                 preloaded=None):
+        self.pdf = pdf
+        self.budget = budget if budget is not None else Budget()
+        self.cache = cache
+        # maximum number of pages that keep their layout (None: no limit), and
+        # what is computed from the layout of a page before it is released
+        self.resident_pages = resident_pages
+        self.summaries = summaries
+        self._resident = OrderedDict()
+        self.profiler = profiler
+        self.hasher = None
+        if cache is not None:
+            from .cache import ObjectHasher
+            # fonts and images shared by several pages are hashed only once
+            self.hasher = ObjectHasher()
+        self._records = [None] * len(pdf.pages)
+        # page index -> results exported by a page worker
+        self.preloaded = preloaded or {}
+        # the pages iterated over (None: all), e.g., the part of a page worker
+        self.selection = None
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, i):
+        if self._records[i] is None:
+            self._records[i] = PageRecord(self.pdf.pages[i], self.budget, self.cache, self.hasher, self.profiler)
+            if i in self.preloaded:
+                self._records[i].preload(self.preloaded[i])
+        if self.resident_pages is not None:
+            self._resident[i] = True
+            self._resident.move_to_end(i)
+            while len(self._resident) > self.resident_pages:
+                oldest, _ = self._resident.popitem(last=False)
+                self._records[oldest].flush(self.summaries)
+        return self._records[i]
+
+    def __iter__(self):
+        for i in (self.selection if self.selection is not None else range(len(self))):
+            yield self[i]
+
+    def timed_out_pages(self):
+        """ Return the (1-based) numbers of the pages that ran out of time. """
+        return [r.index+1 for r in self._records if r is not None and r.timed_out]
+
+    def save(self):
+        """ Write the results of the pages to the cache, if any. """
+        for record in self._records:
+            if record is not None:
+                record.save()
+
+    def close(self):
+        """ Release the layout of all the pages and close the PDF file. """
+        for record in self._records:
+            if record is not None:
+                record.flush()
+        self._resident.clear()
+        self.pdf.close()
@@ -0,0 +1,129 @@
+'''
+Instrumentation of the checks, enabled with --profile.
+
+A Profiler records, for one paper, the wall time, CPU time and peak memory
+of each check and of the work done on each page, and counts the expensive
+operations (page rasterizations, text and word extractions). Peak memory
+is the peak of the memory allocated by Python objects, as traced by
+tracemalloc (which slows the checks down, hence the flag); the peak RSS of
+the whole process is recorded as well, which is what limits the number of
+workers on a machine.
+
+profile_dump additionally runs a paper under cProfile (or pyinstrument,
+if installed) and saves the profile to a file.
+'''
+
+from collections import Counter
+from contextlib import contextmanager
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+MB = 1024 * 1024
+
+
+class Profiler(object):
+    """ Timings, peak memory and counters of the checks and pages of one paper. """
+
+    def __init__(self):
+        self.checks = {}  # check name -> stats
+        self.pages = {}  # page number -> stats
+        self.counters = Counter()
+        # peak memory of the enclosing measurements, see measure
+        self._peaks = []
+        self._started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    @contextmanager
+    def measure(self, table, key):
+        """ Add the wall time, CPU time and peak memory of the body to table[key]. """
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # the peak so far belongs to the enclosing measurement
+            _, peak = tracemalloc.get_traced_memory()
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            tracemalloc.reset_peak()
+            self._peaks.append(0)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            stats = table.setdefault(key, {'wall': 0.0, 'cpu': 0.0, 'peak_mb': 0.0})
+            stats['wall'] += time.perf_counter() - wall
+            stats['cpu'] += time.process_time() - cpu
+            if tracing:
+                _, peak = tracemalloc.get_traced_memory()
+                peak = max(self._peaks.pop(), peak)
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                tracemalloc.reset_peak()
+                stats['peak_mb'] = max(stats['peak_mb'], peak / MB)
+
+    def to_dict(self):
+        max_rss_mb = None
+        if resource is not None:
+            # ru_maxrss is in KB on Linux, and in bytes on macOS
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            max_rss_mb = max_rss / MB if sys.platform == "darwin" else max_rss / 1024
+        return {
+            'checks': self.checks,
+            'pages': {str(page): stats for page, stats in sorted(self.pages.items())},
+            'counters': dict(self.counters),
+            'max_rss_mb': max_rss_mb,
+        }
+
+
+@contextmanager
+def profile_dump(profile_dir, name, profiler="cprofile"):
+    """
+    Run the body under cProfile (saved as <name>.prof, for pstats or
+    snakeviz) or pyinstrument (saved as <name>.html) in profile_dir; do
+    nothing if profile_dir is None.
+    """
+    if profile_dir is None:
+        yield
+        return
+    os.makedirs(profile_dir, exist_ok=True)
+
+    if profiler == "pyinstrument":
+        try:
+            import pyinstrument
+        except ImportError:
+            raise ImportError("pyinstrument is not installed: pip install pyinstrument, or use the cprofile profiler")
+        p = pyinstrument.Profiler()
+        p.start()
+        try:
+            yield
+        finally:
+            p.stop()
+            with open(os.path.join(profile_dir, f"{name}.html"), "w") as f:
+                f.write(p.output_html())
+    else:
+        import cProfile
+        p = cProfile.Profile()
+        p.enable()
+        try:
+            yield
+        finally:
+            p.disable()
+            p.dump_stats(os.path.join(profile_dir, f"{name}.prof"))
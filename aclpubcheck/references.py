@@ -0,0 +1,169 @@
+'''
+Backends that extract the bibliography of a paper as BibTeX.
+
+The name check used to run curl through os.system and exchange the result
+with rebiber through files in a shared temp/ directory. A backend instead
+returns the BibTeX as a string, which is passed to the next stages in
+memory:
+
+- ScholarcyExtractor posts the PDF to the Scholarcy API
+  (https://ref.scholarcy.com/api/) on a pooled HTTP session. Its URL can be
+  pointed to a local stand-in server (e.g., in tests) with the
+  ACLPUBCHECK_SCHOLARCY_URL environment variable.
+- LocalExtractor parses the References section from the pages that the
+  Formatter already opened, without any network access.
+'''
+
+import abc
+from collections import Counter
+import os
+import re
+
+import requests
+
+from .pagelimit import is_bold
+
+
+SCHOLARCY_URL = "https://ref.scholarcy.com/api/references/download"
+
+
+class ReferenceExtractor(abc.ABC):
+    """ Interface of the reference-extraction backends. """
+
+    @abc.abstractmethod
+    def extract(self, pdf_path, pages, config):
+        """
+        Return the references of the paper as a BibTeX string.
+
+        pages are the PageRecords of the paper when it is already open (or
+        None), and config is the name-check configuration.
+        """
+
+
+class ScholarcyExtractor(ReferenceExtractor):
+
+    def __init__(self, url=None, timeout=120):
+        self.url = url or os.environ.get("ACLPUBCHECK_SCHOLARCY_URL", SCHOLARCY_URL)
+        self.timeout = timeout
+        # one session, so that connections are reused across papers
+        self.session = requests.Session()
+
+    def extract(self, pdf_path, pages, config):
+        with open(pdf_path, "rb") as f:
+            try:
+                response = self.session.post(
+                    self.url,
+                    headers={'accept': 'application/json', 'Authorization': 'Bearer '},
+                    files={'file': (os.path.basename(pdf_path), f, 'application/pdf')},
+                    data={
+                        'document_type': 'full_paper',
+                        'references': config.ref_string,
+                        'reference_style': config.mode,
+                        'reference_format': 'bibtex',
+                        'parser': 'v2',
+                        'engine': 'v1',
+                    },
+                    timeout=self.timeout)
+                response.raise_for_status()
+            except requests.RequestException:
+                # without references there is nothing to compare
+                return ""
+        return response.text
+
+
+class LocalExtractor(ReferenceExtractor):
+    """
+    Parses ACL-style references ("Authors. Year. Title. Venue.") from the
+    text layer of the PDF. Entries are separated using the hanging indent of
+    the bibliography: continuation lines are indented.
+    """
+
+    # a line starting an appendix, e.g., "A Appendix" or "B.1 Hyperparameters"
+    appendix_regex = re.compile(r'^(Appendix|[A-Z](\.\d+)*\s+[A-Z][a-z])')
+    entry_regex = re.compile(
+        r'^(?P<authors>.+?)\.\s+(?P<year>(19|20)\d\d[a-z]?)\.\s+(?P<title>.+?[.?!])(\s|$)')
+
+    def extract(self, pdf_path, pages, config):
+        if pages is None:
+            import pdfplumber
+            from .pages import PaperPages
+            with pdfplumber.open(pdf_path) as pdf:
+                return self.extract(pdf_path, PaperPages(pdf), config)
+
+        bibtex = []
+        for n, entry in enumerate(self.reference_entries(pages, config.ref_string)):
+            match = self.entry_regex.match(entry)
+            if not match:
+                continue
+            authors = [a.strip() for a in re.split(r',\s*and\s+|,\s*|\s+and\s+', match.group('authors')) if a.strip()]
+            title = match.group('title').rstrip('.').replace('{', '').replace('}', '')
+            bibtex.append(f"@article{{ref{n+1},\n"
+                          f"  author = {{{' and '.join(authors)}}},\n"
+                          f"  title = {{{title}}},\n"
+                          f"  year = {{{match.group('year')[:4]}}}\n"
+                          f"}}\n")
+        return '\n'.join(bibtex)
+
+    def column_lines(self, page):
+        """
+        Yield the (column, x0, text, heading) lines of a page, column by
+        column; heading is True for the lines set in bold or in a larger size
+        than the body text, as the section headings are.
+        """
+        columns = ([], [])
+        # a tighter tolerance than pdfplumber's default, since the lines of the
+        # bibliography are often typeset with very narrow spaces
+        words = page.extract_words(x_tolerance=1.5, extra_attrs=("fontname", "size"))
+        if not words:
+            return
+        body_size = Counter(round(w["size"], 1) for w in words).most_common(1)[0][0]
+        for word in words:
+            columns[word["x0"] >= page.width / 2].append(word)
+        for column, words in enumerate(columns):
+            lines = []
+            for word in sorted(words, key=lambda w: (round(w["top"]), w["x0"])):
+                if lines and abs(lines[-1][0]["top"] - word["top"]) < 2:
+                    lines[-1].append(word)
+                else:
+                    lines.append([word])
+            for line in lines:
+                heading = all(is_bold(w["fontname"]) or round(w["size"], 1) > body_size + 0.5
+                              for w in line)
+                yield column, line[0]["x0"], ' '.join(w["text"] for w in line), heading
+
+    def reference_entries(self, pages, ref_string):
+        """ Return the text of each entry of the References section. """
+        lines = []
+        in_references = False
+        for page in pages:
+            try:
+                page_lines = list(self.column_lines(page))
+            except Exception:
+                continue
+            for column, x0, text, heading in page_lines:
+                if not in_references:
+                    in_references = text.strip() == ref_string or text.strip().endswith(f" {ref_string}")
+                    continue
+                # only a heading ends the references: entries such as
+                # "A Survey of ..." look like appendix titles too
+                if heading and self.appendix_regex.match(text):
+                    in_references = False
+                    break
+                lines.append(((page.index, column), x0, text))
+            if lines and not in_references:
+                break
+
+        # the first line of an entry starts at the left edge of its column
+        left = {}
+        for column, x0, text in lines:
+            left[column] = min(x0, left.get(column, x0))
+
+        entries = []
+        for column, x0, text in lines:
+            if x0 < left[column] + 2 or not entries:
+                entries.append(text)
+            elif entries[-1].endswith('-'):
+                entries[-1] = entries[-1][:-1] + text
+            else:
+                entries[-1] += ' ' + text
+        return entries
@@ -0,0 +1,100 @@
+'''
+Render-once page bitmaps for the pixel checks and the error images.
+
+Checking whether a candidate margin violation is visible used to crop the
+page and rasterize the crop, once per word or image, and the pages with
+violations were rendered once more to draw the errors-N-page-P.png files. A
+PageRaster instead renders the whole page at most once, lazily, at a
+configurable resolution: the whiteness tests slice the cached bitmap and the
+annotated error image is drawn on the same rendering.
+
+Encoding the error images as PNG can be handed to a thread pool, which runs
+while the next pages are parsed (PIL releases the GIL while it encodes).
+'''
+
+import math
+
+import numpy as np
+from PIL import Image
+
+
+# resolution of the error images saved in preview mode
+PREVIEW_RESOLUTION = 50
+
+
+class PageRaster(object):
+    """ Lazily rendered bitmap of one PageRecord. """
+
+    def __init__(self, record, resolution=150):
+        self.record = record
+        self.resolution = resolution
+        self.scale = resolution / 72  # PDF coordinates are in points (72ppi)
+        self._image = None
+        self._bitmap = None
+
+    @property
+    def image(self):
+        """ The pdfplumber PageImage of the page, rendered on first use. """
+        if self._image is None:
+            with self.record.guard():
+                self.record.count("rasterizations")
+                self._image = self.record.to_image(resolution=self.resolution)
+        return self._image
+
+    @property
+    def bitmap(self):
+        if self._bitmap is None:
+            self._bitmap = np.asarray(self.image.original)
+        return self._bitmap
+
+    def region(self, bbox):
+        """ Return the pixels inside bbox = (x0, top, x1, bottom), in page coordinates. """
+        x0, top, x1, bottom = (v * self.scale for v in bbox)
+        # only take the pixels that are completely inside the box, so that the
+        # anti-aliased edges of neighbouring objects are not picked up
+        region = self.bitmap[max(0, math.ceil(top)):math.floor(bottom), max(0, math.ceil(x0)):math.floor(x1)]
+        if region.size == 0:
+            region = self.bitmap[max(0, round(top)):round(bottom), max(0, round(x0)):round(x1)]
+        return region
+
+    def is_blank(self, bbox, background):
+        """ Return True if all the pixels inside bbox have the background color. """
+        region = self.region(bbox)
+        # an empty region cannot be checked, so it is better to report it
+        return region.size > 0 and np.mean(region) == background
+
+    def save_annotated(self, boxes, path, preview=False, executor=None):
+        """
+        Save the page with a red rectangle around each box as a PNG file.
+
+        With an executor, the image is encoded by one of its threads: return
+        the Future of the file, which is written once it is done.
+        """
+        im = self.image
+        im.reset()
+        for bbox in boxes:
+            im.draw_rect(bbox, fill=None, stroke="red", stroke_width=5)
+        # the job keeps the annotated image, which the next reset replaces
+        annotated = im.annotated
+        if preview and self.resolution > PREVIEW_RESOLUTION:
+            factor = PREVIEW_RESOLUTION / self.resolution
+            width, height = annotated.size
+            size = (max(1, int(width * factor)), max(1, int(height * factor)))
+            job = lambda: annotated.resize(size).save(path, format="PNG")
+        else:
+            job = lambda: encode_png(annotated, path, self.resolution)
+        if executor is not None:
+            return executor.submit(job)
+        job()
+        return None
+
+    def close(self):
+        """ Free the rendering; the page is rendered again if needed. """
+        self._image = None
+        self._bitmap = None
+
+
+def encode_png(image, path, resolution):
+    """ Save an annotated page as pdfplumber's PageImage.save does (quantized to 256 colors). """
+    out = image.quantize(256, method=Image.FASTOCTREE).convert("P")
+    out.save(path, format="PNG", bits=8, dpi=(resolution, resolution))
@@ -0,0 +1,239 @@
+'''
+Result model of a checked paper, and the reporters that consume it.
+
+The checks record Findings (a problem type, a message and, when it is known,
+the page and the area of the page it refers to) in a PaperResult, together
+with the time spent in each check and the status of the paper. Reporters
+turn results into output:
+
+- TerminalReporter prints the colored report of a paper;
+- ProfileReporter prints the time and memory spent in each check;
+- JSONReporter writes the errors-<paper>.json file of a paper;
+- JSONLinesReporter and CSVReporter append the results of many papers to a
+  single file, one record per paper (JSON Lines) or one row per finding
+  (CSV), as they arrive.
+'''
+
+from collections import defaultdict
+import csv
+from dataclasses import dataclass, field
+from enum import Enum
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from termcolor import colored
+
+
+class Error(Enum):
+    SIZE = "Size"
+    PARSING = "Parsing"
+    MARGIN = "Margin"
+    SPELLING = "Spelling"
+    FONT = "Font"
+    PAGELIMIT = "Page Limit"
+
+
+class Warn(Enum):
+    BIB = "Bibliography"
+
+
+# str(problem type) -> problem type, to read back the logs stored as JSON
+PROBLEM_TYPES = {str(e): e for e in list(Error) + list(Warn)}
+
+
+def count_problems(logs):
+    """ Return the number of errors and warnings in a logs dict (parsing errors count as neither). """
+    errors, warnings = 0, 0
+    for e, ms in logs.items():
+        if isinstance(e, Error) and e != Error.PARSING:
+            errors += len(ms)
+        elif e != Error.PARSING:
+            warnings += len(ms)
+    return errors, warnings
+
+
+@dataclass
+class Finding:
+    """ One problem found in a paper. """
+    kind: Enum  # an Error or a Warn
+    message: str
+    check: Optional[str] = None  # the check that found it, e.g., "margin"
+    page: Optional[int] = None  # 1-based
+    bbox: Optional[Tuple[float, float, float, float]] = None  # (x0, top, x1, bottom) in PDF points
+
+    def to_dict(self):
+        return {'kind': str(self.kind), 'message': self.message, 'check': self.check,
+                'page': self.page, 'bbox': list(self.bbox) if self.bbox is not None else None}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(PROBLEM_TYPES[d['kind']], d['message'], d.get('check'), d.get('page'),
+                   tuple(d['bbox']) if d.get('bbox') is not None else None)
+
+
+@dataclass
+class PaperResult:
+    """ The outcome of checking one paper. """
+    path: str
+    paper: Optional[str] = None  # the paper id, e.g., its submission number
+    status: str = "ok"  # "ok", "partial" (ran out of time) or "failed"
+    cached: bool = False  # True if the findings were reused from a previous run
+    findings: List[Finding] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)  # check -> seconds
+    images: List[str] = field(default_factory=list)  # PNG files of the pages with errors
+    traceback: Optional[str] = None
+    profile: Optional[dict] = None  # see profiling.Profiler, when profiled
+
+    @property
+    def logs(self):
+        """ Problem type -> messages, in the order they were found. """
+        logs = defaultdict(list)
+        for finding in self.findings:
+            logs[finding.kind].append(finding.message)
+        return logs
+
+    @property
+    def logs_json(self):
+        return {str(k): v for k, v in self.logs.items()}
+
+    @property
+    def counts(self):
+        """ (errors, warnings) """
+        return count_problems(self.logs)
+
+    def to_dict(self):
+        errors, warnings = self.counts
+        return {
+            'path': self.path,
+            'paper': self.paper,
+            'status': self.status,
+            'cached': self.cached,
+            'errors': errors,
+            'warnings': warnings,
+            'logs': self.logs_json,
+            'findings': [f.to_dict() for f in self.findings],
+            'timings': self.timings,
+            'images': self.images,
+            'traceback': self.traceback,
+            'profile': self.profile,
+        }
+
+
+class TerminalReporter(object):
+    """ Prints the report of a paper, with the problems found and what to do about them. """
+
+    def __init__(self, output_file_name="errors-{paper}.json"):
+        self.output_file_name = output_file_name
+
+    def report(self, result):
+        logs = result.logs
+        if result.cached:
+            print("The paper did not change since it was last checked.")
+
+        if logs:
+            print(f"Errors. Check {self.output_file_name.format(paper=result.paper)} for details.")
+
+            errors, warnings = result.counts
+            for e, ms in logs.items():
+                for m in ms:
+                    if isinstance(e, Error) and e != Error.PARSING:
+                        print(colored("Error ({0}):".format(e.value), "red")+" "+m)
+                    elif e == Error.PARSING:
+                        print(colored("Parsing Error:".format(e.value), "yellow")+" "+m)
+                    else:
+                        print(colored("Warning ({0}):".format(e.value), "yellow")+" "+m)
+
+            # English nominal morphology
+            error_text = "errors"
+            if errors == 1:
+                error_text = "error"
+            warning_text = "warnings"
+            if warnings == 1:
+                warning_text = "warning"
+
+            # display to user
+            print()
+            print("We detected {0} {1} and {2} {3} in your paper.".format(*(errors, error_text, warnings, warning_text)))
+            print("In general, it is required that you fix errors for your paper to be published. Fixing warnings is optional, but recommended.")
+            print("Important: Some of the margin errors may be spurious. The library detects the location of images, but not whether they have a white background that blends in.")
+            print("Important: Some of the warnings generated for citations may be spurious and inaccurate, due to parsing and indexing errors.")
+            print("We encourage you to double check the citations and update them depending on the latest source. If you believe that your citation is updated and correct, then please ignore those warnings.")
+        else:
+            print(colored("All Clear!", "green"))
+
+
+class ProfileReporter(object):
+    """ Prints the time and memory spent in each check of a profiled paper, and its slowest pages. """
+
+    def __init__(self, slowest_pages=5):
+        self.slowest_pages = slowest_pages
+
+    def report(self, result):
+        profile = result.profile
+        print()
+        print(f"Profile of {result.paper} (total {result.timings.get('total', 0):.2f}s, "
+              f"peak RSS {profile['max_rss_mb'] or 0:.0f}MB):")
+        print("  {:<12} {:>8} {:>8} {:>10}".format("check", "wall (s)", "cpu (s)", "peak (MB)"))
+        for check, stats in profile['checks'].items():
+            print("  {:<12} {:>8.2f} {:>8.2f} {:>10.1f}".format(check, stats['wall'], stats['cpu'], stats['peak_mb']))
+        pages = sorted(profile['pages'].items(), key=lambda item: item[1]['wall'], reverse=True)
+        for page, stats in pages[:self.slowest_pages]:
+            print("  page {:<7} {:>8.2f} {:>8.2f} {:>10.1f}".format(page, stats['wall'], stats['cpu'], stats['peak_mb']))
+        print("  " + ", ".join(f"{n} {name}" for name, n in sorted(profile['counters'].items())))
+
+
+class JSONReporter(object):
+    """ Writes the logs of each paper to errors-<paper>.json in output_dir (even if they are empty). """
+
+    def __init__(self, output_dir="."):
+        self.output_dir = output_dir
+
+    def report(self, result):
+        with open(os.path.join(self.output_dir, "errors-{0}.json".format(result.paper)), 'w') as f:
+            json.dump(result.logs_json, f)
+
+
+class JSONLinesReporter(object):
+    """ Appends one JSON record per paper to a file. """
+
+    def __init__(self, path):
+        self.file = open(path, 'w')
+
+    def report(self, result):
+        self.file.write(json.dumps(result.to_dict()) + "\n")
+        # records are available as soon as each paper is checked
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CSVReporter(object):
+    """ Appends one row per finding (or per paper, for papers without findings) to a file. """
+
+    columns = ['path', 'paper', 'status', 'kind', 'check', 'page', 'bbox', 'message']
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.columns)
+
+    def report(self, result):
+        paper = [result.path, result.paper, result.status]
+        if not result.findings:
+            self.writer.writerow(paper + [None] * 5)
+        for finding in result.findings:
+            bbox = " ".join("{:.1f}".format(v) for v in finding.bbox) if finding.bbox is not None else None
+            self.writer.writerow(paper + [finding.kind.value, finding.check, finding.page, bbox, finding.message])
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def make_file_reporter(path):
+    """ Return the reporter for a results file: CSV if its name ends with .csv, JSON Lines otherwise. """
+    if path.endswith(".csv"):
+        return CSVReporter(path)
+    return JSONLinesReporter(path)
@@ -0,0 +1,257 @@
+'''
+Server mode: keep the checker warm between submissions.
+
+    aclpubcheck-server [--host HOST] [--port PORT | --socket PATH] [--num_workers N] [options]
+
+Starting Python, importing pdfplumber and pdfminer and loading the rebiber
+database (for the reference checks) take longer than checking most papers.
+The server pays these costs once: it keeps a pool of worker processes, each
+with the Formatter built by batch.init_worker, and checks each submission
+on the next free worker. It listens on a TCP port (local only by default)
+or on a Unix socket, and answers in JSON:
+
+- GET /health: the number of workers and of the submissions in progress;
+- POST /check with a JSON body {"path": ..., "paper_type": ..., "check_references": ...}:
+  check a PDF that the server can read (paper_type and check_references
+  are optional, and default to the options of the server);
+- POST /check?name=<file name>&paper_type=...&check_references=... with the
+  PDF as body (Content-Type: application/pdf): check an uploaded PDF. The
+  paper id is read from the file name, as on the command line.
+
+Both return the result of the paper (see results.PaperResult.to_dict); the
+images of the pages with errors are saved in --output_dir. When all the
+slots for pending submissions (--max_pending) are taken, the server answers
+503 instead of queuing more work.
+'''
+
+import argparse
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from multiprocessing.pool import Pool
+import os
+import shutil
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+from urllib.parse import parse_qs, urlparse
+
+from .batch import check_request, init_worker, split_pages
+from .formatchecker import add_check_arguments, config_from_args
+
+
+PAPER_TYPES = ("short", "long", "demo", "other")
+
+
+class RequestError(Exception):
+    """ A request that cannot be served, with the HTTP status to answer. """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_bool(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    return str(value).lower() in ("1", "true", "yes")
+
+
+class CheckServer(ThreadingHTTPServer):
+    """ HTTP server that checks the submitted PDFs on a pool of warm workers. """
+
+    daemon_threads = True
+
+    def __init__(self, address, config, num_workers=1, max_pending=None,
+                 max_papers_per_worker=None, max_upload_mb=100):
+        self.config = config
+        self.num_workers = num_workers
+        # submissions accepted (checked or waiting for a worker) at the same time
+        self.max_pending = max_pending or 4 * num_workers
+        self.max_upload_bytes = max_upload_mb * 1024 * 1024
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.upload_dir = tempfile.mkdtemp(prefix="aclpubcheck-uploads-")
+        if config.check_references and not config.disable_name_check:
+            # load the bib DB once, before forking, so that the workers share it
+            from .bibdb import preload_bib_db
+            preload_bib_db()
+        # workers are replaced after max_papers_per_worker papers, to bound
+        # the memory that a long-running process may accumulate
+        self.pool = Pool(num_workers, initializer=init_worker, initargs=(config,),
+                         maxtasksperchild=max_papers_per_worker)
+        super().__init__(address, CheckHandler)
+
+    def check(self, pdf_path, paper_type=None, check_references=None):
+        """ Check a PDF on the next free worker and return its result as a dict. """
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE, "Too many submissions in progress, retry later")
+            self.pending += 1
+        try:
+            pages, elapsed = None, 0.0
+            if self.config.page_workers > 1:
+                # the pages are split across the workers, to answer sooner
+                pages, elapsed = split_pages(self.pool, pdf_path, self.config.page_workers, check_references)
+            return self.pool.apply(check_request, (pdf_path, paper_type, check_references, pages, elapsed))
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def check_upload(self, name, data, paper_type=None, check_references=None):
+        """ Check an uploaded PDF, stored only while it is checked. """
+        name = os.path.basename(name or "") or "submission.pdf"
+        if not name.endswith(".pdf"):
+            name += ".pdf"
+        upload_dir = tempfile.mkdtemp(dir=self.upload_dir)
+        try:
+            pdf_path = os.path.join(upload_dir, name)
+            with open(pdf_path, "wb") as f:
+                f.write(data)
+            result = self.check(pdf_path, paper_type, check_references)
+        finally:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+        # the temporary path means nothing to the client
+        result['path'] = name
+        return result
+
+    def health(self):
+        with self.lock:
+            pending = self.pending
+        return {'status': 'ok', 'workers': self.num_workers, 'pending': pending,
+                'max_pending': self.max_pending}
+
+    def server_close(self):
+        super().server_close()
+        self.pool.terminate()
+        self.pool.join()
+        shutil.rmtree(self.upload_dir, ignore_errors=True)
+
+
+class UnixCheckServer(CheckServer):
+    """ CheckServer listening on a Unix socket. """
+
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # a socket file left by a previous server would make bind fail
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        socketserver.TCPServer.server_bind(self)
+        self.server_name, self.server_port = self.server_address, None
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class CheckHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            self.send_json(HTTPStatus.OK, self.server.health())
+        else:
+            self.send_json(HTTPStatus.NOT_FOUND, {'error': f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        try:
+            if url.path != "/check":
+                raise RequestError(HTTPStatus.NOT_FOUND, f"Unknown path {url.path}")
+            self.send_json(HTTPStatus.OK, self.handle_check(url))
+        except RequestError as e:
+            self.send_json(e.status, {'error': str(e)})
+
+    def handle_check(self, url):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > self.server.max_upload_bytes:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "The submission is too large")
+        body = self.rfile.read(length)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip()
+        if content_type == "application/pdf":
+            paper_type, check_references = self.check_options(params)
+            if not body.startswith(b"%PDF"):
+                raise RequestError(HTTPStatus.BAD_REQUEST, "The body is not a PDF")
+            return self.server.check_upload(params.get('name'), body, paper_type, check_references)
+
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "The body is neither JSON nor a PDF")
+        if not isinstance(request, dict) or not request.get('path'):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Missing the path of the PDF to check")
+        paper_type, check_references = self.check_options(dict(params, **request))
+        if not os.path.isfile(request['path']):
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"No such file: {request['path']}")
+        return self.server.check(request['path'], paper_type, check_references)
+
+    @staticmethod
+    def check_options(params):
+        paper_type = params.get('paper_type')
+        if paper_type is not None and paper_type not in PAPER_TYPES:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"Unknown paper type {paper_type}")
+        return paper_type, parse_bool(params.get('check_references'))
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        if status == HTTPStatus.SERVICE_UNAVAILABLE:
+            self.send_header('Retry-After', '5')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # clients of a Unix socket have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the submitted PDFs on a pool of warm workers.")
+    add_check_arguments(parser)
+    parser.add_argument('--check_references', action='store_true',
+                        help="run the reference checks, unless a request says otherwise")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--socket', default=None,
+                        help="listen on this Unix socket instead of a TCP port")
+    parser.add_argument('--num_workers', type=int, default=1)
+    parser.add_argument('--output_dir', default=".",
+                        help="where the images of the pages with errors are saved")
+    parser.add_argument('--max_pending', type=int, default=None,
+                        help="maximum number of submissions in progress (default: 4 per worker)")
+    parser.add_argument('--max_papers_per_worker', type=int, default=None,
+                        help="replace each worker process after this many papers")
+    parser.add_argument('--max_upload_mb', type=float, default=100)
+    args = parser.parse_args()
+
+    config = config_from_args(args, check_references=args.check_references, output_dir=args.output_dir)
+    options = dict(num_workers=args.num_workers, max_pending=args.max_pending,
+                   max_papers_per_worker=args.max_papers_per_worker, max_upload_mb=args.max_upload_mb)
+    if args.socket:
+        server = UnixCheckServer(args.socket, config, **options)
+    else:
+        server = CheckServer((args.host, args.port), config, **options)
+
+    # stop cleanly (terminating the workers) on SIGTERM as on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Listening on {args.socket or f'http://{args.host}:{args.port}'} with {args.num_workers} workers",
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
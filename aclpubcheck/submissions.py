@@ -0,0 +1,83 @@
+'''
+Loader of the submission information exported from START (a CSV file with
+one row per submission), shared by the tools of the publication chairs.
+
+Only the columns used by the tools are read, and the author columns (First,
+Middle and Last Name and Affiliation for each of the 24 author slots) are
+reshaped at once into the authors of each submission, rather than looked up
+cell by cell on each row.
+'''
+
+import collections
+
+import numpy as np
+import pandas as pd
+
+
+# NOTE: These were the names in the custom final submission form
+# for NAACL 2021. Names and structure may be different depending
+# on your final submission form.
+ID_COLUMN = "Submission ID"
+FIELD_COLUMNS = {
+    "title": "Title",
+    "signature": "copyrightSig",
+    "org_name": "orgName",
+    "org_address": "orgAddress",
+    "job_title": "jobTitle",
+}
+# optional, in the exports of conferences with several tracks
+TRACK_COLUMN = "Track"
+MAX_AUTHORS = 24
+NAME_PARTS = ("First", "Middle", "Last")
+
+
+def author_columns(i):
+    """ The columns of the i-th author (1-based): the parts of the name, then the affiliation. """
+    return [f"{i}: {x} Name" for x in NAME_PARTS] + [f"{i}: Affiliation"]
+
+
+class Author(collections.namedtuple("Author", ["first", "middle", "last", "affiliation"])):
+    __slots__ = ()
+
+    @property
+    def name_parts(self):
+        return self.first, self.middle, self.last
+
+    @property
+    def name(self):
+        return ' '.join(part for part in self.name_parts if part)
+
+
+Submission = collections.namedtuple(
+    "Submission", ["row", "id"] + list(FIELD_COLUMNS) + ["track", "authors"])
+Submission.__doc__ = """
+A row of the submission information: its 0-based index among the rows, the
+submission id, the fields of FIELD_COLUMNS (stripped strings), the track
+('' without a track column) and the authors, a tuple of Author (stripped
+strings) for the author slots whose name is not empty.
+"""
+
+
+def read_submissions(submissions_path, track_column=TRACK_COLUMN):
+    """ Yield a Submission for each row of the CSV file of the submission information. """
+    slots = [author_columns(i) for i in range(1, MAX_AUTHORS + 1)]
+    wanted = {ID_COLUMN, track_column, *FIELD_COLUMNS.values(),
+              *(column for slot in slots for column in slot)}
+    df = pd.read_csv(submissions_path, usecols=lambda column: column in wanted,
+                     dtype=str, keep_default_na=False)
+    missing = [column for column in [ID_COLUMN, *FIELD_COLUMNS.values()] if column not in df]
+    if missing:
+        raise ValueError(f"{submissions_path} has no column {', '.join(missing)}")
+    df = df.apply(lambda column: column.str.strip())
+
+    # exports may have fewer author slots than MAX_AUTHORS; the missing ones are empty
+    authors = df.reindex(columns=[column for slot in slots for column in slot], fill_value='')
+    authors = authors.to_numpy(dtype=object).reshape(len(df), MAX_AUTHORS, len(slots[0]))
+    has_name = (authors[:, :, :len(NAME_PARTS)] != '').any(axis=2)
+
+    ids = df[ID_COLUMN].astype(int).tolist()
+    fields = [df[column].tolist() for column in FIELD_COLUMNS.values()]
+    fields.append(df[track_column].tolist() if track_column in df else [''] * len(df))
+    for row, (submission_id, *values) in enumerate(zip(ids, *fields)):
+        yield Submission(row, submission_id, *values,
+                         tuple(Author(*authors[row, i]) for i in np.flatnonzero(has_name[row])))
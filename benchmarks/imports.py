@@ -0,0 +1,87 @@
+'''
+Import-time budget of the command line.
+
+    python -m benchmarks.imports [--budget_ms 100] [--repeat 5]
+
+Runs `python -X importtime -m aclpubcheck --help` and reports the time spent
+importing the aclpubcheck modules (median over the runs) and the wall time
+of the whole command, next to that of an empty interpreter. The command
+fails if the imports exceed the budget, or if --help loads one of the
+heavy dependencies, which must only be imported by the checks that need
+them.
+'''
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+# dependencies that the command line must not load before a check needs them
+HEAVY_MODULES = ("pdfplumber", "pdfminer", "numpy", "pandas", "rebiber", "pybtex",
+                 "pylatexenc", "requests", "PIL", "pypdfium2")
+
+
+def parse_importtime(stderr):
+    """ Return {module: (self us, cumulative us, depth)} from the output of -X importtime. """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def measure(command):
+    """ Return the wall time (seconds) and the -X importtime output of a Python command. """
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime"] + command,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return time.perf_counter() - start, process.stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the command line.")
+    parser.add_argument('--budget_ms', type=float, default=100,
+                        help="maximum time spent importing the aclpubcheck modules")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    empty_times, cli_times, import_times = [], [], []
+    modules = {}
+    for _ in range(args.repeat):
+        empty_times.append(measure(["-c", "pass"])[0])
+        wall, stderr = measure(["-m", "aclpubcheck", "--help"])
+        modules = parse_importtime(stderr)
+        cli_times.append(wall)
+        # the top-level imports of the package include everything they import in turn
+        import_times.append(sum(cumulative for name, (_, cumulative, depth) in modules.items()
+                                if depth == 0 and name.split(".")[0] == "aclpubcheck") / 1000)
+
+    imports_ms = statistics.median(import_times)
+    print(f"python -c pass:          {statistics.median(empty_times) * 1000:6.0f} ms")
+    print(f"aclpubcheck --help:      {statistics.median(cli_times) * 1000:6.0f} ms")
+    print(f"aclpubcheck imports:     {imports_ms:6.0f} ms (budget {args.budget_ms:.0f} ms)")
+
+    slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:10]
+    print("slowest modules (self time):")
+    for name, (self_us, _, _) in slowest:
+        print(f"  {name:<40} {self_us / 1000:6.1f} ms")
+
+    failed = False
+    heavy = sorted(name for name in modules if name.split(".")[0] in HEAVY_MODULES and "." not in name)
+    if heavy:
+        print(f"--help imports heavy dependencies: {', '.join(heavy)}")
+        failed = True
+    if imports_ms > args.budget_ms:
+        print("The imports exceed the budget")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
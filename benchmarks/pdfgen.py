@@ -0,0 +1,200 @@
+'''
+Generator of synthetic ACL-like PDFs for the benchmarks.
+
+The PDFs are written directly (with the standard Times fonts, which need
+no embedding), so that generating them needs no dependency and gives the
+same file on every machine. Each scenario stresses a different part of the
+checker:
+
+- dense_text: two columns of small text on every page (text extraction);
+- many_images: dozens of small images per page (image parsing);
+- margin_bleed: colored text and images running into the margins (the
+  pixel checks and the error images);
+- long_paper: a long paper with appendices (every per-page cost, memory);
+- vector_heavy: figures made of thousands of vector paths (layout analysis
+  and rendering);
+- non_a4: US letter pages (the size check, and pages skipped by the others).
+'''
+
+import random
+import zlib
+
+
+A4 = (595, 842)
+LETTER = (612, 792)
+
+WORDS = ("the of and to in a is that for model language we on with as are by this "
+         "be from our which an results task data can performance using learning "
+         "neural training table figure section dataset evaluation baseline").split()
+
+
+class PDFWriter(object):
+    """ Minimal PDF writer: pages with a content stream, the standard Times fonts and RGB images. """
+
+    def __init__(self):
+        self.objects = []  # bytes of each object, numbered from 1
+        self.pages = []
+        self.pages_id = self.reserve()
+        self.fonts = {"F1": self.add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Times-Roman >>"),
+                      "F2": self.add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Times-Bold >>")}
+
+    def reserve(self):
+        self.objects.append(None)
+        return len(self.objects)
+
+    def add(self, data, obj_id=None):
+        if obj_id is None:
+            obj_id = self.reserve()
+        self.objects[obj_id - 1] = data
+        return obj_id
+
+    def stream(self, attrs, data, compress=True):
+        if compress:
+            data = zlib.compress(data)
+            attrs += b" /Filter /FlateDecode"
+        return self.add(b"<< %s /Length %d >>\nstream\n%s\nendstream" % (attrs, len(data), data))
+
+    def image(self, width, height, rgb):
+        """ Add an image XObject from raw RGB bytes and return its object id. """
+        return self.stream(b"/Type /XObject /Subtype /Image /Width %d /Height %d "
+                           b"/ColorSpace /DeviceRGB /BitsPerComponent 8" % (width, height), rgb)
+
+    def page(self, content, size=A4, images=None):
+        """ Add a page with the given content stream (str) and images ({name: object id}). """
+        contents = self.stream(b"", content.encode("latin-1"))
+        fonts = b" ".join(b"/%s %d 0 R" % (name.encode(), obj_id) for name, obj_id in self.fonts.items())
+        xobjects = b" ".join(b"/%s %d 0 R" % (name.encode(), obj_id) for name, obj_id in (images or {}).items())
+        self.pages.append(self.add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+            b"/Resources << /Font << %s >> /XObject << %s >> >> >>"
+            % (self.pages_id, size[0], size[1], contents, fonts, xobjects)))
+
+    def save(self, path):
+        kids = b" ".join(b"%d 0 R" % page for page in self.pages)
+        self.add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.pages)), self.pages_id)
+        catalog = self.add(b"<< /Type /Catalog /Pages %d 0 R >>" % self.pages_id)
+
+        out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for obj_id, data in enumerate(self.objects, 1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n%s\nendobj\n" % (obj_id, data)
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(self.objects) + 1)
+        for offset in offsets:
+            out += b"%010d 00000 n \n" % offset
+        out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(self.objects) + 1, catalog, xref)
+        with open(path, "wb") as f:
+            f.write(out)
+
+
+def escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def sentence(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def text_block(rng, x, top, lines, size=10, leading=12, words=9, page_height=A4[1], font="F1"):
+    """ Return the content stream of a block of lines, starting at top (from the top of the page). """
+    ops = [f"BT /{font} {size} Tf {leading} TL {x} {page_height - top} Td"]
+    for _ in range(lines):
+        ops.append(f"({escape(sentence(rng, words))}) '")
+    ops.append("ET")
+    return "\n".join(ops)
+
+
+def heading(x, top, text, page_height=A4[1]):
+    return f"BT /F2 12 Tf {x} {page_height - top} Td ({escape(text)}) Tj ET"
+
+
+def two_columns(rng, lines=62, size=10, leading=11, words=6):
+    """ The body of an ACL-like page: two columns inside the margins. """
+    return "\n".join([text_block(rng, 71, 72, lines, size, leading, words),
+                      text_block(rng, 306, 72, lines, size, leading, words)])
+
+
+def paper(rng, pages, body, references_page=9, size=A4):
+    """ Write a paper whose pages are built by body(rng, page_number) -> (content, images). """
+    writer = PDFWriter()
+    for n in range(1, pages + 1):
+        content, images = body(writer, rng, n)
+        if n == references_page:
+            content += "\n" + heading(306, 66, "References")
+        writer.page(content, size=size, images=images)
+    return writer
+
+
+def dense_text(rng, scale=1):
+    return paper(rng, 10 * scale, lambda w, rng, n: (two_columns(rng, lines=85, size=7, leading=8, words=8), {}))
+
+
+def many_images(rng, scale=1):
+    def body(writer, rng, n):
+        images, ops = {}, [two_columns(rng, lines=20)]
+        for k in range(40):
+            rgb = bytes(rng.randrange(256) for _ in range(16 * 16 * 3))
+            name = f"Im{k}"
+            images[name] = writer.image(16, 16, rgb)
+            x, y = 80 + (k % 8) * 55, 300 + (k // 8) * 55
+            ops.append(f"q 48 0 0 48 {x} {y} cm /{name} Do Q")
+        return "\n".join(ops), images
+    return paper(rng, 10 * scale, body)
+
+
+def margin_bleed(rng, scale=1):
+    def body(writer, rng, n):
+        ops = [two_columns(rng)]
+        # colored words running into the left, right and top margins
+        ops.append("0.2 0.2 0.6 rg")
+        ops.append(text_block(rng, 20, 200, 3, words=4))
+        ops.append(text_block(rng, 480, 400, 3, words=8))
+        ops.append(text_block(rng, 200, 30, 1, words=5))
+        ops.append("0 0 0 rg")
+        # an image bleeding into the right margin
+        rgb = bytes(rng.randrange(256) for _ in range(32 * 32 * 3))
+        image = writer.image(32, 32, rgb)
+        ops.append("q 120 0 0 90 460 150 cm /Im0 Do Q")
+        # a page number in the bottom margin
+        ops.append(f"BT /F1 10 Tf 297 30 Td ({n}) Tj ET")
+        return "\n".join(ops), {"Im0": image}
+    return paper(rng, 10 * scale, body)
+
+
+def long_paper(rng, scale=1):
+    return paper(rng, 80 * scale, lambda w, rng, n: (two_columns(rng), {}))
+
+
+def vector_heavy(rng, scale=1):
+    def body(writer, rng, n):
+        ops = [two_columns(rng, lines=25), "0.5 w"]
+        # a plot made of thousands of short segments and small markers
+        for _ in range(3000):
+            x, y = rng.uniform(80, 520), rng.uniform(80, 400)
+            ops.append(f"{x:.2f} {y:.2f} m {x + rng.uniform(-4, 4):.2f} {y + rng.uniform(-4, 4):.2f} l S")
+        for _ in range(1000):
+            x, y = rng.uniform(80, 520), rng.uniform(80, 400)
+            ops.append(f"{x:.2f} {y:.2f} 1.5 1.5 re f")
+        return "\n".join(ops), {}
+    return paper(rng, 10 * scale, body)
+
+
+def non_a4(rng, scale=1):
+    return paper(rng, 10 * scale,
+                 lambda w, rng, n: (two_columns(rng), {}), size=LETTER)
+
+
+SCENARIOS = {
+    "dense_text": dense_text,
+    "many_images": many_images,
+    "margin_bleed": margin_bleed,
+    "long_paper": long_paper,
+    "vector_heavy": vector_heavy,
+    "non_a4": non_a4,
+}
+
+
+def generate(name, path, scale=1, seed=0):
+    """ Write the PDF of a scenario to path; the same seed gives the same file. """
+    SCENARIOS[name](random.Random(seed), scale).save(path)
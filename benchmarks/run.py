@@ -0,0 +1,156 @@
+'''
+Benchmarks of the format checker on synthetic pathological PDFs.
+
+    python -m benchmarks.run [--scenarios dense_text long_paper ...] [--repeat 3]
+                             [--scale 1] [--save_baseline] [--baseline FILE]
+
+Each scenario PDF (see benchmarks/pdfgen.py) is generated once in the work
+directory, then checked with Formatter.format_check in a fresh process per
+run, so that the peak RSS of a run is not inflated by the previous ones.
+For each scenario, the benchmark reports the median time of format_check
+and of each check, the throughput in papers per minute and the peak RSS.
+
+Timings depend on the machine: save a baseline (--save_baseline) before a
+change, and compare against it after. Scenarios slower than the baseline
+by more than --tolerance are reported as regressions, and make the command
+fail with --fail_on_regression.
+'''
+
+import argparse
+import contextlib
+import json
+from multiprocessing import get_context
+import os
+import statistics
+import sys
+import time
+
+from .pdfgen import SCENARIOS, generate
+
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+
+
+def run_once(pdf_path, output_dir, options):
+    """ Check one PDF in this process and return its timings (seconds) and peak RSS (MB). """
+    import resource
+    from aclpubcheck.formatchecker import Formatter
+
+    formatter = Formatter(disable_name_check=True, **options)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        formatter.format_check(pdf_path, "long", output_dir=output_dir)
+    total = time.perf_counter() - start
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = {name: seconds for name, seconds in formatter.result.timings.items() if name != "total"}
+    return {
+        "format_check": total,
+        "checks": timings,
+        "peak_rss_mb": max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024,
+    }
+
+
+def run_scenario(name, work_dir, repeat, scale, options):
+    # the checker uses the file name up to the first "_" as the paper id
+    pdf_path = os.path.join(work_dir, f"{name.replace('_', '-')}-x{scale}.pdf")
+    if not os.path.exists(pdf_path):
+        generate(name, pdf_path, scale=scale)
+    output_dir = os.path.join(work_dir, "output")
+    os.makedirs(output_dir, exist_ok=True)
+
+    runs = []
+    # a fresh process per run, so that each run starts cold and has its own peak RSS
+    ctx = get_context("spawn")
+    for _ in range(repeat):
+        with ctx.Pool(1) as pool:
+            runs.append(pool.apply(run_once, (pdf_path, output_dir, options)))
+
+    total = statistics.median(run["format_check"] for run in runs)
+    return {
+        "format_check": total,
+        "papers_per_minute": 60 / total if total > 0 else None,
+        "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+        "checks": {check: statistics.median(run["checks"].get(check, 0) for run in runs)
+                   for check in runs[0]["checks"]},
+        "pdf_size_kb": os.path.getsize(pdf_path) / 1024,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """ Print the change of each scenario against the baseline; return the names of the regressions. """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["format_check"], result["format_check"]
+        change = (after - before) / before if before > 0 else 0.0
+        flag = ""
+        if change > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"  {name:<14} {before:8.2f}s -> {after:8.2f}s ({change:+.0%}){flag}")
+    return regressions
+
+
+def print_results(results):
+    print("{:<14} {:>10} {:>12} {:>10}  {}".format("scenario", "time (s)", "papers/min", "RSS (MB)", "checks (s)"))
+    for name, result in results.items():
+        checks = ", ".join(f"{check} {seconds:.2f}" for check, seconds in result["checks"].items())
+        print("{:<14} {:>10.2f} {:>12.1f} {:>10.0f}  {}".format(
+            name, result["format_check"], result["papers_per_minute"] or 0, result["peak_rss_mb"], checks))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the format checker on synthetic PDFs.")
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument('--repeat', type=int, default=3, help="runs per scenario (the median is reported)")
+    parser.add_argument('--scale', type=int, default=1, help="multiply the number of pages of each scenario")
+    parser.add_argument('--work_dir', default=os.path.join(BENCHMARKS_DIR, "work"),
+                        help="where the PDFs are generated and checked")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save_baseline', action='store_true', help="store the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="relative slowdown over the baseline reported as a regression")
+    parser.add_argument('--fail_on_regression', action='store_true')
+    parser.add_argument('--output', default=None, help="also write the results to this JSON file")
+    # options of the Formatter, to compare configurations
+    parser.add_argument('--resolution', type=int, default=150)
+    parser.add_argument('--annotations', choices={"full", "preview", "none"}, default="full")
+    parser.add_argument('--resident_pages', type=int, default=None)
+    args = parser.parse_args()
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    options = {"resolution": args.resolution, "annotations": args.annotations,
+               "resident_pages": args.resident_pages}
+
+    results = {}
+    for name in args.scenarios:
+        results[name] = run_scenario(name, args.work_dir, args.repeat, args.scale, options)
+        print(f"{name}: {results[name]['format_check']:.2f}s", file=sys.stderr)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print()
+        print(f"Compared to {args.baseline}:")
+        regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved the baseline to {args.baseline}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
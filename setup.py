@@ -4,26 +4,34 @@ from setuptools import setup, find_packages
 install_requires = [
 	"tqdm",
 	"termcolor",
-	"pandas",
+	"numpy",
 	"pdfplumber",
 	"rebiber<2.0.0",  # 2.0 introduces breaking changes
 	"pybtex",
 	"pylatexenc",
 	"setuptools",
 	"Unidecode",
-	"tsv"
+	"tsv",
+	"requests"
 ]
 
+# only needed by the tools of the publication chairs (metadatachecker, copyright_signatures)
+extras_require = {
+	"metadata": ["pandas"],
+}
+
 
 setup(
 	name="aclpubcheck",
 	install_requires=install_requires,
+	extras_require=extras_require,
 	version="0.1",
 	scripts=[],
 	packages=find_packages(include=["aclpubcheck*"]),
 	entry_points = {
 		'console_scripts': [
 			"aclpubcheck=aclpubcheck.__main__:main",
+			"aclpubcheck-server=aclpubcheck.server:main",
   		],	
 	},
 )
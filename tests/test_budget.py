@@ -0,0 +1,15 @@
+import time
+
+import pytest
+
+from aclpubcheck.budget import Budget, BudgetExceeded
+
+
+def test_timeout_swallowed_by_the_body_still_propagates():
+    budget = Budget(page_timeout=0.05)
+    with pytest.raises(BudgetExceeded):
+        with budget.guard(page_remaining=0.05):
+            try:
+                time.sleep(1)
+            except Exception:
+                pass
@@ -0,0 +1,15 @@
+import tracemalloc
+
+import pytest
+
+from aclpubcheck.formatchecker import Formatter
+
+
+def test_profiler_stops_when_the_pdf_cannot_be_read(tmp_path):
+    submission = tmp_path / "1_corrupt.pdf"
+    submission.write_bytes(b"%PDF-1.5\nthis is not a PDF\n")
+
+    formatter = Formatter(profile=True)
+    with pytest.raises(Exception):
+        formatter.check(str(submission), "long", output_dir=str(tmp_path))
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+from aclpubcheck.name_check import PDFNameCheck, deduplicate_entries
+from aclpubcheck.references import LocalExtractor
+
+
+BIB = """
+@article{ref1,
+  author = {Ashish Vaswani and Noam Shazeer},
+  title = {Attention is all you need},
+  year = {2017}
+}
+
+@article{ref2,
+  author = {Jane Doe}
+}
+
+@article{ref1,
+  author = {John Smith},
+  title = {A repeated key},
+  year = {2020}
+}
+"""
+
+OFFICIAL = """@inproceedings{vaswani2017attention,
+  author = {Vaswani, Ashish and Shazeer, Noam and Parmar, Niki},
+  title = {Attention is All you Need},
+  booktitle = {Advances in Neural Information Processing Systems},
+  year = {2017}
+}
+"""
+
+
+class NameCheck(PDFNameCheck):
+    bib_db = {"attentionisallyouneed": [OFFICIAL]}
+
+
+def test_repeated_keys_are_dropped():
+    text = deduplicate_entries(BIB)
+    assert text.count("{ref1,") == 1
+    assert "A repeated key" not in text
+
+
+def test_untitled_entries_are_skipped():
+    old_bib_data, new_bib_data = NameCheck().apply_rebiber(BIB)
+    assert list(old_bib_data.entries) == ["ref1", "ref2"]
+    assert list(new_bib_data.entries) == ["ref1"]
+
+
+def test_entries_found_in_the_bib_db_are_replaced():
+    old_bib_data, new_bib_data = NameCheck().apply_rebiber(BIB)
+    assert len(old_bib_data.entries["ref1"].persons["author"]) == 2
+    assert len(new_bib_data.entries["ref1"].persons["author"]) == 3
+    assert "booktitle" in new_bib_data.entries["ref1"].fields
+
+
+class Page(object):
+    """ A page of a single column, each of whose lines is a single word. """
+
+    width = 600
+
+    def __init__(self, index, lines):
+        self.index = index
+        self.lines = lines
+
+    def extract_words(self, **kwargs):
+        return [{"text": text, "x0": x0, "top": 10.0 * i, "size": 10.0,
+                 "fontname": "Times-Bold" if bold else "Times-Roman"}
+                for i, (x0, text, bold) in enumerate(self.lines)]
+
+
+def test_local_references_end_at_the_appendix_heading():
+    pages = [
+        Page(0, [(50, "Introduction", True),
+                 (50, "Some text.", False),
+                 (50, "References", True),
+                 (50, "Jane Doe. 2020. A Survey of things.", False),
+                 (60, "In Proceedings.", False)]),
+        Page(1, [(50, "John Smith and Ann Lee. 2021. Another title. In", False),
+                 (60, "Proceedings.", False),
+                 (50, "A Appendix", True),
+                 (50, "Bob Roe. 2019. Not a reference.", False)]),
+    ]
+    bibtex = LocalExtractor().extract("paper.pdf", pages, SimpleNamespace(ref_string="References"))
+    assert "title = {A Survey of things}" in bibtex
+    assert "author = {John Smith and Ann Lee}" in bibtex
+    assert "Not a reference" not in bibtex